@@ -0,0 +1,115 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+DEFAULT_BATCH_CONCURRENCY = 2
+MAX_BATCH_QUESTIONS = 500
+
+
+def read_questions(path):
+    """Questions from a .txt (one per line), .json (list) or .jsonl ({"question": ...} per line) file"""
+    with open(path, encoding='utf-8') as f:
+        if path.endswith('.json'):
+            items = json.load(f)
+        elif path.endswith('.jsonl'):
+            items = [json.loads(line) for line in f if line.strip()]
+        else:
+            items = [line for line in f if line.strip() and not line.lstrip().startswith('#')]
+    questions = [item.get('question', '') if isinstance(item, dict) else str(item) for item in items]
+    return [q.strip() for q in questions if q.strip()]
+
+
+def answered_indexes(output_path):
+    """Indexes already answered without error in an existing JSONL output (used to resume a run)"""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # Linha incompleta de uma execução interrompida
+            if record.get('error') is None:
+                done.add(record.get('index'))
+    return done
+
+
+class BatchRunner:
+    """Answer a list of questions with one CsvAgent, sharing data, LLM clients and agents.
+
+    Questions run on a bounded pool; each answer is appended to the JSONL output
+    as soon as it is ready, so an interrupted run keeps what it already did.
+    """
+
+    def __init__(self, csv_agent, model=None, mode=None, concurrency=DEFAULT_BATCH_CONCURRENCY):
+        self.csv_agent = csv_agent
+        self.model = model
+        self.mode = mode
+        self.concurrency = max(1, concurrency)
+        self._write_lock = threading.Lock()
+
+    def warm_up(self):
+        """Create the LLM client and the per-file agents once, before the questions compete for them"""
+        model = self.csv_agent.find_available_model(self.model)
+        if model is None or self.mode == 'sql':
+            return
+        try:
+            llm = self.csv_agent.agent_cache.get_llm(model, lambda: self.csv_agent._create_llm(model))
+            for file, df in list(self.csv_agent.dataframes.items()):
+                self.csv_agent.agent_cache.get_agent(
+                    model, file, self.csv_agent.fingerprints.get(file),
+                    lambda: self.csv_agent.create_agent_with_fallback(llm, df, file, model=model))
+        except Exception as e:
+            # Sem aquecimento os agentes são criados na primeira pergunta
+            print(f"Erro ao preparar os agentes do lote: {e}")
+
+    def run(self, questions, output_path, resume=False, on_result=None):
+        """Answer all questions, appending one JSON record per answer to output_path; returns a summary"""
+        skip = answered_indexes(output_path) if resume else set()
+        pending = [(index, question) for index, question in enumerate(questions) if index not in skip]
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        print(f"Lote: {len(pending)} pergunta(s) a responder ({len(skip)} já respondida(s)), "
+              f"{self.concurrency} em paralelo")
+        start = time.monotonic()
+        self.warm_up()
+        summary = {'total': len(questions), 'skipped': len(skip), 'answered': 0, 'errors': 0,
+                   'output': output_path}
+        with open(output_path, 'a' if resume else 'w', encoding='utf-8') as out, \
+                ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='batch') as pool:
+            futures = [pool.submit(self._answer, index, question) for index, question in pending]
+            for future in as_completed(futures):
+                record = future.result()
+                with self._write_lock:
+                    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    out.flush()
+                summary['errors' if record['error'] else 'answered'] += 1
+                if on_result is not None:
+                    on_result(record)
+        summary['seconds'] = round(time.monotonic() - start, 2)
+        print(f"Lote concluído em {summary['seconds']}s: {summary['answered']} resposta(s), "
+              f"{summary['errors']} erro(s). Resultados em {output_path}")
+        return summary
+
+    def _answer(self, index, question):
+        start = time.monotonic()
+        answer, error = None, None
+        try:
+            answer, complete = self.csv_agent.answer_query(question, self.model, mode=self.mode)
+            # Falhas voltam como texto: registra como erro para que --resume as repita
+            if not complete:
+                failures = [line.strip() for line in (answer or '').splitlines() if line.strip().startswith('Erro')]
+                error = "; ".join(failures)[:500] or "Resposta incompleta"
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        return {
+            'index': index,
+            'question': question,
+            'model': self.model,
+            'mode': self.mode,
+            'answer': answer,
+            'error': error,
+            'seconds': round(time.monotonic() - start, 3),
+        }
@@ -1,21 +1,132 @@
 import os
-import zipfile
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, TimeoutError as FuturesTimeout
 import pandas as pd
 from langchain_openai import OpenAI
 from langchain_experimental.agents.agent_toolkits import create_pandas_dataframe_agent
-from prompts.agent_prompt_pt import CSV_AGENT_PROMPT_TEMPLATE
+from langchain_core.tools import Tool
+from prompts.agent_prompt_pt import (CSV_AGENT_PROMPT_TEMPLATE, CSV_AGENT_PROMPT_COMPACT, CSV_PROFILE_PROMPT_TEMPLATE,
+                                     SQL_AGENT_PROMPT_TEMPLATE)
+from agents.query_router import QueryRouter
+from agents.sql_agent import SqlEngine, SQL_AGENT_CACHE_FILE, SQL_DB_NAME
+from agents.model_health import (ModelHealthRegistry, classify_error, MODEL_DOWN_ERRORS,
+                                 DEFAULT_FAILURE_THRESHOLD, DEFAULT_COOLDOWN_SECONDS)
+from utils.agent_cache import AgentCache, private_copy
+from utils.answer_cache import AnswerCache, DEFAULT_TTL_SECONDS, DEFAULT_MAX_ENTRIES
+from utils.file_tracker import FileTracker, FileState
+from utils.file_unpacker import ArchiveUnpacker, open_member, member_digest, DEFAULT_UNPACK_WORKERS
+from utils.columnar_cache import ColumnarCache, CACHE_DIR_NAME
+from utils.shared_store import SharedStore
+from utils.profiler import build_profile, describe_profile
+from utils.file_router import FileIndex, DEFAULT_TOP_K, DEFAULT_MIN_RELATIVE_SCORE
+from utils.dataframe_compactor import compact_dataframe, memory_usage_mb
+from utils.chunked_reader import (read_csv_streaming, chunked_aggregate, describe_summary, AGGREGATIONS,
+                                  DEFAULT_STREAM_THRESHOLD_MB, DEFAULT_CHUNK_ROWS, DEFAULT_SAMPLE_ROWS)
 import traceback
+from utils.metrics import metrics, span, submit_in_context
+from utils.token_budget import TokenBudget
+from utils.rate_limiter import RateLimiter
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv(os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env'))
 
+# Limite padrão de agentes executando em paralelo e timeout (segundos) por arquivo
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_FILE_TIMEOUT = 120
+# Número máximo de agentes mantidos em cache (LRU)
+DEFAULT_AGENT_CACHE_SIZE = 32
+# Modos de consulta: um agente pandas por arquivo, ou um único agente SQL sobre todas as tabelas
+QUERY_MODES = ('per_file', 'sql')
+# Número máximo de modelos tentados por consulta quando o modelo escolhido está fora do ar
+MAX_MODEL_ATTEMPTS = 3
+
+# Níveis de redução do perfil quando o prompt não cabe no orçamento: (colunas detalhadas, linhas de exemplo)
+PROFILE_LEVELS = ((None, True), (40, True), (20, False), (0, False))
+
+# List of backup models to try (ordered by reliability)
+BACKUP_MODELS = [
+    "deepseek/deepseek-prover-v2:free",           # Usually very reliable
+    "google/gemma-2-9b-it:free",                  # Good stability
+    "meta-llama/llama-3.2-3b-instruct:free",     # Popular choice
+    "microsoft/phi-3-mini-128k-instruct:free",   # Microsoft model
+    "mistralai/mistral-7b-instruct:free",        # Mistral AI
+    "qwen/qwen-2-7b-instruct:free",              # Alibaba model
+    "nousresearch/nous-capybara-7b:free",        # Alternative option
+    "openchat/openchat-7b:free",                 # Additional backup
+    "huggingfaceh4/zephyr-7b-beta:free"          # Final fallback
+]
+
+class FileQueryTimeout(Exception):
+    """Raised when a per-file agent run exceeds its time budget"""
+
 class CsvAgent:
-    def __init__(self):
+    def __init__(self, max_workers=None, file_timeout=None, agent_cache_size=None, compact=None,
+                 data_dir=None, llm_factory=None):
         self.dataframes = {}
-        self.data_dir = os.path.join(os.path.dirname(__file__), '..', 'data')
-        self._unpack_archives()
-        self._load_csvs()
+        self.fingerprints = {}
+        # Compactação opcional dos dataframes (categóricas e downcast numérico)
+        self.compact = compact if compact is not None else os.environ.get('CSV_AGENT_COMPACT', '0') == '1'
+        self.arrow_strings = os.environ.get('CSV_AGENT_ARROW_STRINGS', '0') == '1'
+        self.memory_report = {}
+        # Arquivos grandes: lidos em blocos, com amostra em memória e resumo exato
+        self.stream_threshold_mb = float(os.environ.get('CSV_AGENT_STREAM_THRESHOLD_MB', DEFAULT_STREAM_THRESHOLD_MB))
+        self.chunk_rows = int(os.environ.get('CSV_AGENT_CHUNK_ROWS', DEFAULT_CHUNK_ROWS))
+        self.sample_rows = int(os.environ.get('CSV_AGENT_SAMPLE_ROWS', DEFAULT_SAMPLE_ROWS))
+        self.sampled_files = {}
+        # Perfil por arquivo (tipos, nulos, cardinalidade...) incluído no prompt do agente
+        self.profiles = {}
+        # Índice invertido para consultar apenas os arquivos relevantes à pergunta
+        self.file_index = FileIndex()
+        self.route_top_k = int(os.environ.get('CSV_AGENT_ROUTE_TOP_K', DEFAULT_TOP_K))
+        self.route_min_score = float(os.environ.get('CSV_AGENT_ROUTE_MIN_SCORE', DEFAULT_MIN_RELATIVE_SCORE))
+        # Modo SQL: banco SQLite em data/.cache/, com as tabelas construídas na primeira consulta nesse modo
+        self.query_mode = os.environ.get('CSV_AGENT_QUERY_MODE', 'per_file')
+        # Saúde dos modelos: latência, erros e circuit breaker com pausa após falhas
+        self.model_health = ModelHealthRegistry(
+            failure_threshold=int(os.environ.get('CSV_AGENT_MODEL_FAILURES', DEFAULT_FAILURE_THRESHOLD)),
+            cooldown_seconds=float(os.environ.get('CSV_AGENT_MODEL_COOLDOWN', DEFAULT_COOLDOWN_SECONDS)))
+        # Requisições "hedged": segundos até disparar a mesma pergunta em outro modelo (0 desativa)
+        self.hedge_after = float(os.environ.get('CSV_AGENT_HEDGE_AFTER', 0))
+        self.debug = os.environ.get('CSV_AGENT_DEBUG', '0') == '1'
+        # Limite de execuções do agente por minuto (respeita a cota dos modelos gratuitos; 0 desativa)
+        rate_limit = float(os.environ.get('CSV_AGENT_RATE_LIMIT_RPM', 0))
+        self.rate_limiter = RateLimiter(rate_limit) if rate_limit > 0 else None
+        # Respostas diretas (sem LLM) para perguntas simples de agregação
+        self.fast_path = os.environ.get('CSV_AGENT_FAST_PATH', '1') != '0'
+        self.query_router = QueryRouter(self.dataframes, self.sampled_files)
+        self.file_tracker = FileTracker()
+        self.agent_cache = AgentCache(
+            max_agents=int(agent_cache_size or os.environ.get('CSV_AGENT_CACHE_SIZE', DEFAULT_AGENT_CACHE_SIZE)))
+        # Cache de respostas (TTL + LRU), opcionalmente persistido em SQLite
+        self.answer_cache = AnswerCache(
+            max_entries=int(os.environ.get('CSV_AGENT_ANSWER_CACHE_SIZE', DEFAULT_MAX_ENTRIES)),
+            ttl_seconds=float(os.environ.get('CSV_AGENT_ANSWER_CACHE_TTL', DEFAULT_TTL_SECONDS)),
+            db_path=os.environ.get('CSV_AGENT_ANSWER_CACHE_DB'))
+        # Concorrência e timeout por arquivo (configuráveis via ambiente)
+        self.max_workers = max(1, int(max_workers or os.environ.get('CSV_AGENT_MAX_WORKERS', DEFAULT_MAX_WORKERS)))
+        self.file_timeout = float(file_timeout or os.environ.get('CSV_AGENT_FILE_TIMEOUT', DEFAULT_FILE_TIMEOUT))
+        self.data_dir = data_dir or os.environ.get('CSV_AGENT_DATA_DIR') or os.path.join(os.path.dirname(__file__), '..', 'data')
+        # Fábrica opcional de LLM (model -> llm), usada no lugar do OpenRouter (ex.: benchmarks offline)
+        self.llm_factory = llm_factory
+        # Cache colunar (Feather) ao lado dos CSVs para acelerar a inicialização
+        # Store compartilhado entre workers: dataframes mapeados do cache colunar + contador de versão
+        self.shared_store = SharedStore(self.data_dir) if os.environ.get('CSV_AGENT_SHARED_STORE', '0') == '1' else None
+        self.store_version = None
+        self.columnar_cache = ColumnarCache(
+            self.data_dir, enabled=self.shared_store is not None or os.environ.get('CSV_AGENT_COLUMNAR_CACHE', '1') != '0',
+            zero_copy=self.shared_store is not None)
+        # Extração incremental dos .zip; CSVs podem ser lidos direto do arquivo compactado
+        self.unpacker = ArchiveUnpacker(
+            self.data_dir,
+            max_workers=int(os.environ.get('CSV_AGENT_UNPACK_WORKERS', DEFAULT_UNPACK_WORKERS)),
+            csv_to_disk=os.environ.get('CSV_AGENT_UNPACK_CSV_TO_DISK', '1') != '0',
+            max_virtual_mb=self.stream_threshold_mb)
+        self.archive_members = {}
+        self.sql_engine = SqlEngine(os.path.join(self.data_dir, CACHE_DIR_NAME, SQL_DB_NAME))
+        self._load_lock = threading.Lock()
+        self.reload_data()
         
         # Don't create LLM instance in __init__ - create it when needed
         # Usando o prompt personalizado em português do template
@@ -32,31 +143,212 @@ class CsvAgent:
         else:
             print("✅ Variáveis de ambiente configuradas corretamente.")
 
+    def reload_data(self):
+        """Extract new archive members and (re)load the CSVs that changed"""
+        with self._load_lock:
+            if self.shared_store is None:
+                self._unpack_archives()
+                self._load_csvs()
+                return
+            # Um worker por vez: os demais encontram os arquivos já no cache colunar e só os mapeiam
+            with self.shared_store.lock():
+                self._unpack_archives()
+                self._load_csvs()
+                self.store_version = self.shared_store.publish(dict(self.fingerprints))
+
+    def refresh_if_stale(self):
+        """Reload when another worker published new datasets (shared store only)"""
+        if self.shared_store is None or self.shared_store.version() == self.store_version:
+            return
+        print(f"Dados atualizados por outro worker (versão {self.shared_store.version()}); recarregando")
+        self.reload_data()
+
     def _unpack_archives(self):
-        if not os.path.exists(self.data_dir):
-            os.makedirs(self.data_dir)
-        for file in os.listdir(self.data_dir):
-            if file.endswith('.zip'):
-                with zipfile.ZipFile(os.path.join(self.data_dir, file), 'r') as zip_ref:
-                    zip_ref.extractall(self.data_dir)
+        with span('unpack'):
+            _, self.archive_members = self.unpacker.sync()
 
     def _load_csvs(self):
-        for file in os.listdir(self.data_dir):
-            if file.endswith('.csv'):
-                # Load full dataframe without sampling
-                try:
-                    df = pd.read_csv(os.path.join(self.data_dir, file), encoding='latin1', on_bad_lines='skip')
-                    self.dataframes[file] = df
-                except (UnicodeDecodeError, pd.errors.ParserError) as e:
-                    print(f"Erro ao carregar {file}: {e}")
+        """Incrementally (re)load the CSVs: parse only new/modified files and drop deleted ones"""
+        virtual = {name: FileState(member.size, member.mtime, member_digest(member))
+                   for name, member in self.archive_members.items()}
+        with span('csv_load'):
+            changed, deleted = self.file_tracker.scan(self.data_dir, '.csv', extra=virtual)
+            self._apply_changes(changed, deleted)
+
+    def _apply_changes(self, changed, deleted):
+        for file in deleted:
+            print(f"Arquivo removido do diretório de dados: {file}")
+            self._drop_dataframe(file)
+            self.file_tracker.forget(file)
+            self.columnar_cache.remove(file)
+        for file, state in changed:
+            try:
+                with span('csv_read', detail=file):
+                    df = self._read_csv(file, state)
+                # Conteúdo mudou: descarta apenas os agentes deste arquivo
+                self.agent_cache.invalidate(file=file)
+                self.dataframes[file] = df
+                self.fingerprints[file] = state.digest
+                with span('csv_profile', detail=file):
+                    self.profiles[file] = build_profile(df)
+                    self.file_index.add(file, df)
+            except (UnicodeDecodeError, pd.errors.ParserError) as e:
+                print(f"Erro ao carregar {file}: {e}")
+                self._drop_dataframe(file)
+            # Marca como processado mesmo com erro, para não reprocessar até o arquivo mudar
+            self.file_tracker.mark_loaded(file, state)
+        if changed or deleted:
+            print(f"CSVs atualizados: {len(changed)} carregado(s), {len(deleted)} removido(s)")
+
+    def _read_csv(self, file, state):
+        """Read a CSV from the columnar cache when it is up to date, otherwise parse and cache it"""
+        path = os.path.join(self.data_dir, file)
+        member = self.archive_members.get(file)
+        if state.size > self.stream_threshold_mb * 1024 * 1024 and member is None:
+            print(f"{file} excede {self.stream_threshold_mb:g} MB: leitura em blocos com amostragem")
+            metrics.inc('csv_reads_total', source='stream')
+            df, summary = read_csv_streaming(path, chunk_rows=self.chunk_rows, sample_rows=self.sample_rows)
+            self.sampled_files[file] = summary
+            return self._compact_dataframe(file, df)
+        self.sampled_files.pop(file, None)
+        df = self.columnar_cache.load(file, state)
+        if df is not None:
+            print(f"{file} carregado do cache colunar")
+            metrics.inc('csv_reads_total', source='columnar_cache')
+            # Mapeado sem cópia: já foi compactado antes de ir para o cache, compactar de novo copiaria
+            return self._compact_dataframe(file, df, apply=not self.columnar_cache.zero_copy)
+        # Load full dataframe without sampling
+        metrics.inc('csv_reads_total', source='parse')
+        if member is not None:
+            # CSV lido direto do .zip, sem passar pelo disco
+            with open_member(member) as stream:
+                df = pd.read_csv(stream, encoding='latin1', on_bad_lines='skip')
+        else:
+            df = pd.read_csv(path, encoding='latin1', on_bad_lines='skip')
+        # Compacta antes de gravar o cache, para que os tipos inferidos sejam reaproveitados
+        df = self._compact_dataframe(file, df)
+        self.columnar_cache.store(file, state, df)
+        return df
 
-    def create_agent_with_fallback(self, llm, df, filename):
+    def _compact_dataframe(self, file, df, apply=True):
+        """Apply the optional compaction stage and record memory use before/after"""
+        before = memory_usage_mb(df)
+        if self.compact and apply:
+            df = compact_dataframe(df, arrow_strings=self.arrow_strings)
+        after = memory_usage_mb(df)
+        self.memory_report[file] = {'before_mb': round(float(before), 2), 'after_mb': round(float(after), 2)}
+        if self.compact and apply:
+            print(f"Memória de {file}: {before:.2f} MB -> {after:.2f} MB")
+        return df
+
+    def _drop_dataframe(self, file):
+        self.dataframes.pop(file, None)
+        self.memory_report.pop(file, None)
+        self.sampled_files.pop(file, None)
+        self.profiles.pop(file, None)
+        self.file_index.remove(file)
+        self.fingerprints.pop(file, None)
+        self.agent_cache.invalidate(file=file)
+
+    def _create_llm(self, model):
+        """Create the OpenAI client for a model with explicit parameters for OpenRouter"""
+        if self.llm_factory is not None:
+            return self.llm_factory(model)
+        return OpenAI(
+            openai_api_key=self.api_key,
+            openai_api_base=self.api_base,
+            model=model,
+            temperature=0
+        )
+
+    def _agent_prefix(self, filename, budget=None):
+        """Build the agent prefix: the custom prompt plus the profile and the exact summary of sampled files.
+
+        With a budget, the largest variant that fits the model's context is
+        used: the profile is trimmed first, then the compact prompt replaces the
+        full one (only when the default prompt was not customized).
+        """
+        summary = self.sampled_files.get(filename)
+        notice = ""
+        if summary:
+            notice = (
+                "\n\nIMPORTANTE: o dataframe `df` é uma AMOSTRA aleatória do arquivo completo. "
+                "Para contagens, somas, médias, mínimos e máximos exatos use as estatísticas abaixo "
+                "ou a ferramenta `agregacao_exata`.\n" + self._escape_braces(describe_summary(summary))
+            )
+        profile = self.profiles.get(filename)
+        if budget is None or not profile:
+            section = CSV_PROFILE_PROMPT_TEMPLATE.format(
+                profile=self._escape_braces(describe_profile(profile))) if profile else ""
+            return self.custom_prompt + section + notice
+
+        # Do maior para o menor: prompt completo com os dois primeiros níveis do perfil, depois o compacto
+        variants = [('completo', self.custom_prompt, level) for level in PROFILE_LEVELS]
+        if self.custom_prompt == CSV_AGENT_PROMPT_TEMPLATE:
+            variants = variants[:2] + [('compacto', CSV_AGENT_PROMPT_COMPACT, level) for level in PROFILE_LEVELS[1:]]
+        candidates = []
+        for prompt_label, prompt, (max_columns, include_sample) in variants:
+            text = describe_profile(profile, max_columns=max_columns, include_sample=include_sample)
+            label = f"{prompt_label}/{max_columns if max_columns is not None else 'todas'}"
+            candidates.append((label, prompt + CSV_PROFILE_PROMPT_TEMPLATE.format(
+                profile=self._escape_braces(text)) + notice))
+        label, prefix = budget.choose(candidates)
+        if label != candidates[0][0]:
+            print(f"Prompt de {filename} reduzido para caber em {budget.window} tokens ({budget.model}): {label}")
+            metrics.inc('prompt_trimmed_total', variant=label)
+        return prefix
+
+    @staticmethod
+    def _escape_braces(text):
+        # O prefixo vira um PromptTemplate: chaves nos dados seriam lidas como variáveis
+        return text.replace('{', '{{').replace('}', '}}')
+
+    def _extra_tools(self, filename):
+        """Tools added to the pandas agent; sampled files get an exact chunked aggregation tool"""
+        summary = self.sampled_files.get(filename)
+        if not summary:
+            return []
+
+        def aggregate(spec):
+            parts = [part.strip() for part in spec.strip().strip('"\'').split('|')]
+            if len(parts) not in (2, 3):
+                return "Formato inválido. Use: coluna|operacao ou coluna|operacao|coluna_agrupamento"
+            try:
+                result = chunked_aggregate(summary['path'], parts[0], parts[1].lower(),
+                                           by=parts[2] if len(parts) == 3 else None,
+                                           chunk_rows=self.chunk_rows)
+            except (ValueError, KeyError) as e:
+                return f"Erro na agregação: {e}"
+            return result.to_string() if isinstance(result, pd.Series) else str(result)
+
+        return [Tool(
+            name="agregacao_exata",
+            func=aggregate,
+            description=(
+                "Calcula uma agregação exata sobre o arquivo CSV completo (não apenas a amostra). "
+                f"Entrada: 'coluna|operacao' ou 'coluna|operacao|coluna_agrupamento', "
+                f"com operacao em: {', '.join(AGGREGATIONS)}."
+            ),
+        )]
+
+    def create_agent_with_fallback(self, llm, df, filename, model=None):
         """Create an agent with fallback handling for parsing errors"""
+        # Orçamento de tokens do modelo: escolhe a variante do prompt e limita a saída das ferramentas
+        budget = TokenBudget(model or getattr(llm, 'model_name', None))
+        with span('agent_create', detail=filename):
+            agent, agent_type = self._create_agent(llm, df, filename, budget)
+        agent.tools = budget.cap_tools(agent.tools)
+        return agent, agent_type
+
+    def _create_agent(self, llm, df, filename, budget):
+        print(f"Criando agente para {filename} com {len(df)} linhas")
         try:
             # First attempt: Use standard agent
             agent = create_pandas_dataframe_agent(
                 llm, df, verbose=False, allow_dangerous_code=True, 
-                prefix=self.custom_prompt
+                prefix=self._agent_prefix(filename, budget), extra_tools=self._extra_tools(filename),
+                # O perfil já traz linhas de exemplo; evita repetir df.head() no prompt
+                include_df_in_prompt=filename not in self.profiles
             )
             print(f"Agente padrão criado com sucesso para {filename}")
             return agent, "standard"
@@ -65,20 +357,37 @@ class CsvAgent:
             try:
                 # Fallback: Use agent without custom prompt
                 agent = create_pandas_dataframe_agent(
-                    llm, df, verbose=False, allow_dangerous_code=True
+                    llm, df, verbose=False, allow_dangerous_code=True,
+                    extra_tools=self._extra_tools(filename),
+                    # Tabelas largas: df.head() com 5 linhas pode sozinho estourar a janela do modelo
+                    number_of_head_rows=5 if budget.fits(df.head(5).to_markdown()) else 1
                 )
                 print(f"Agente fallback (sem prompt customizado) criado para {filename}")
+                metrics.inc('agent_fallbacks_total')
                 return agent, "fallback"
             except Exception as e2:
                 print(f"Erro ao criar agente fallback para {filename}: {e2}")
                 raise e2
 
-    def execute_query_with_retry(self, agent, query, filename, max_retries=3):
+    def execute_query_with_retry(self, agent, query, filename, max_retries=3, cancel_event=None, model=None):
         """Execute query with retry logic for parsing errors"""
+        # Agentes em cache são compartilhados entre consultas simultâneas: cada execução usa o seu REPL
+        agent = private_copy(agent)
         for attempt in range(max_retries):
+            # Não inicia novas tentativas se a consulta já foi abandonada (timeout)
+            if cancel_event is not None and cancel_event.is_set():
+                raise FileQueryTimeout(f"Consulta cancelada para {filename}")
             try:
                 print(f"Tentativa {attempt + 1} para {filename}")
-                result = agent.invoke({"input": query})
+                invoke_start = time.monotonic()
+                try:
+                    self._wait_rate_limit()
+                    with span('llm_invoke', detail=filename, model=model or 'desconhecido'):
+                        result = agent.invoke({"input": query})
+                except Exception as e:
+                    self._record_model_outcome(model, error=e)
+                    raise
+                self._record_model_outcome(model, latency=time.monotonic() - invoke_start)
                 
                 # Check if result has the expected structure
                 if isinstance(result, dict) and 'output' in result:
@@ -94,11 +403,14 @@ class CsvAgent:
             except ValueError as ve:
                 if "Could not parse LLM output" in str(ve):
                     print(f"Erro de parsing na tentativa {attempt + 1} para {filename}: {ve}")
+                    metrics.inc('retries_total', reason='parse')
                     if attempt == max_retries - 1:
                         # Last attempt - try with a simpler query
                         try:
                             simple_query = f"Analise os dados e responda: {query}"
-                            result = agent.invoke({"input": simple_query})
+                            self._wait_rate_limit()
+                            with span('llm_invoke', detail=filename, model=model or 'desconhecido'):
+                                result = agent.invoke({"input": simple_query})
                             if isinstance(result, dict) and 'output' in result:
                                 return result['output']
                             return str(result)
@@ -107,139 +419,359 @@ class CsvAgent:
                 else:
                     raise ve
             except Exception as e:
-                if attempt == max_retries - 1:
+                # Modelo fora do ar ou sem cota: repetir no mesmo modelo só desperdiça tempo
+                if attempt == max_retries - 1 or classify_error(e) in MODEL_DOWN_ERRORS:
                     raise e
                 print(f"Erro na tentativa {attempt + 1} para {filename}: {e}")
+                metrics.inc('retries_total', reason=classify_error(e))
         
         return f"Não foi possível processar a consulta para {filename} após {max_retries} tentativas."
 
+    def _wait_rate_limit(self):
+        if self.rate_limiter is not None:
+            with span('rate_limit_wait'):
+                self.rate_limiter.acquire()
+
+    def _record_model_outcome(self, model, latency=None, error=None):
+        if model is None:
+            return
+        if error is None:
+            self.model_health.record_success(model, latency)
+        else:
+            self.model_health.record_failure(model, classify_error(error))
+
     def find_available_model(self, preferred_model=None):
-        """Find the first available model from a list of options"""
-        # List of backup models to try (ordered by reliability)
-        backup_models = [
-            "deepseek/deepseek-prover-v2:free",           # Usually very reliable
-            "google/gemma-2-9b-it:free",                  # Good stability
-            "meta-llama/llama-3.2-3b-instruct:free",     # Popular choice
-            "microsoft/phi-3-mini-128k-instruct:free",   # Microsoft model
-            "mistralai/mistral-7b-instruct:free",        # Mistral AI
-            "qwen/qwen-2-7b-instruct:free",              # Alibaba model
-            "nousresearch/nous-capybara-7b:free",        # Alternative option
-            "openchat/openchat-7b:free",                 # Additional backup
-            "huggingfaceh4/zephyr-7b-beta:free"          # Final fallback
-        ]
-        
+        """Find the preferred model if it is healthy, otherwise the fastest healthy backup model"""
         # First try the preferred model if provided
-        if preferred_model:
+        if preferred_model and self.model_health.is_available(preferred_model):
             print(f"Usando modelo solicitado: {preferred_model}")
             return preferred_model
+        if preferred_model:
+            print(f"Modelo solicitado {preferred_model} em pausa após falhas recentes; buscando alternativa")
         
-        # If no preferred model, return the first backup model
-        print(f"Nenhum modelo específico solicitado, usando padrão: {backup_models[0]}")
-        return backup_models[0]
+        # Otherwise, the fastest healthy backup model
+        ranked = self.model_health.rank(BACKUP_MODELS)
+        if not ranked:
+            return None
+        print(f"Usando o modelo saudável mais rápido: {ranked[0]}")
+        return ranked[0]
+
+    def _model_candidates(self, model):
+        """Models to try for a query: the chosen model followed by the other healthy ones, fastest first"""
+        first = self.find_available_model(model)
+        if first is None:
+            return []
+        return [first] + [m for m in self.model_health.rank(BACKUP_MODELS) if m != first]
+
+    def process_query(self, query, model=None, on_partial=None, mode=None):
+        """Answer a question over all loaded CSVs.
+
+        on_partial, when given, is called as on_partial(file, text, success) as
+        soon as each file finishes (used to stream partial results). mode is
+        'per_file' (one pandas agent per CSV) or 'sql' (a single agent over all
+        CSVs as SQL tables); it defaults to CSV_AGENT_QUERY_MODE.
+        """
+        response, _ = self.answer_query(query, model, on_partial, mode)
+        return response
+
+    def answer_query(self, query, model=None, on_partial=None, mode=None):
+        """Same as process_query, but returns (response, complete).
+
+        complete is False when the response is an error message or when any
+        file could not be answered, so callers can tell failures apart from answers.
+        """
+        mode = mode if mode in QUERY_MODES else self.query_mode
+        # Vários workers: aplica uploads feitos em outro processo antes de responder
+        self.refresh_if_stale()
+        # Caminho rápido: perguntas simples são respondidas direto com pandas
+        if self.fast_path:
+            try:
+                fast_answer = self.query_router.try_answer(query)
+            except Exception as e:
+                print(f"Erro no caminho rápido, usando o agente: {e}")
+                fast_answer = None
+            if fast_answer is not None:
+                print("Pergunta respondida diretamente com pandas (sem LLM)")
+                metrics.inc('queries_total', path='fast_path')
+                return f"Resultado da análise (resposta direta, sem uso de LLM):\n\n{fast_answer}", True
 
-    def process_query(self, query, model=None):
         # Check if environment variables are set
-        if not self.api_key or not self.api_base:
-            return "Erro: Variáveis de ambiente OPENAI_API_KEY e OPENAI_API_BASE não estão definidas. Configure-as e reinicie o aplicativo."
+        if self.llm_factory is None and (not self.api_key or not self.api_base):
+            return "Erro: Variáveis de ambiente OPENAI_API_KEY e OPENAI_API_BASE não estão definidas. Configure-as e reinicie o aplicativo.", False
+        
+        # Cache de respostas: mesma pergunta (normalizada), modelo e dados
+        start_time = time.monotonic()
+        cache_key = self.answer_cache.make_key(query, model, dict(self.fingerprints), mode=mode)
+        cached = self.answer_cache.get(cache_key)
+        if cached is not None:
+            elapsed_ms = (time.monotonic() - start_time) * 1000
+            print(f"Resposta recuperada do cache em {elapsed_ms:.1f} ms")
+            metrics.inc('queries_total', path='answer_cache')
+            return f"♻️ Resposta recuperada do cache ({elapsed_ms:.1f} ms)\n\n{cached}", True
+        
+        metrics.inc('queries_total', path=mode)
+        with span('llm_answer', mode=mode):
+            response, complete = self._answer_with_agents(query, model, on_partial, mode)
+        # Só armazena respostas completas (sem erros em nenhum arquivo)
+        if complete:
+            self.answer_cache.set(cache_key, response)
+        return response, complete
+
+    def _answer_with_agents(self, query, model, on_partial=None, mode='per_file'):
+        """Answer the query with the LLM agents, falling back to other healthy models; returns (response, complete)"""
         
         # Find an available model
         print(f"Modelo solicitado: {model}")
-        available_model = self.find_available_model(model)
-        
-        # Create a new instance of OpenAI with the available model
-        llm = None
-        models_to_try = [
-            available_model,
-            "google/gemma-2-9b-it:free",
-            "meta-llama/llama-3.2-3b-instruct:free",
-            "microsoft/phi-3-mini-128k-instruct:free"
-        ]
+        candidates = self._model_candidates(model)
+        if not candidates:
+            return ("Erro: Todos os modelos estão temporariamente em pausa após falhas recentes "
+                    "(limite de requisições ou indisponibilidade). Tente novamente em alguns minutos."), False
         
-        # Try models until one works
-        for model_to_try in models_to_try:
-            if model_to_try is None:
-                continue
+        response = None
+        for position, available_model in enumerate(candidates[:MAX_MODEL_ATTEMPTS]):
             try:
-                print(f"Tentando criar LLM com modelo: {model_to_try}")
-                
-                # Create LLM with explicit parameters for OpenRouter
-                llm = OpenAI(
-                    openai_api_key=self.api_key,
-                    openai_api_base=self.api_base,
-                    model=model_to_try,
-                    temperature=0
-                )
-                available_model = model_to_try
-                print(f"LLM criado com sucesso para o modelo: {available_model}")
-                break
+                # Reuse the cached OpenAI client for the model when possible
+                print(f"Tentando criar LLM com modelo: {available_model}")
+                llm = self.agent_cache.get_llm(available_model, lambda: self._create_llm(available_model))
             except Exception as e:
-                print(f"Erro ao criar LLM com {model_to_try}: {e}")
+                print(f"Erro ao criar LLM com {available_model}: {e}")
+                self._record_model_outcome(available_model, error=e)
                 continue
+            
+            # Hedge: se um arquivo demorar, dispara a mesma pergunta no próximo modelo saudável
+            hedge_model = next((m for m in candidates[position + 1:] if self.model_health.is_available(m)), None)
+            with span('model_attempt', detail=available_model, model=available_model):
+                if mode == 'sql':
+                    response, complete, answered = self._answer_with_sql(query, llm, available_model, on_partial)
+                else:
+                    response, complete, answered = self._answer_per_file(
+                        query, llm, available_model, on_partial, hedge_model if self.hedge_after > 0 else None)
+            
+            # Troca de modelo apenas quando nada foi respondido e o circuito do modelo abriu
+            if answered or self.model_health.is_available(available_model):
+                return response, complete
+            print(f"Modelo {available_model} indisponível; tentando o próximo modelo saudável")
+            metrics.inc('model_fallbacks_total', model=available_model)
         
-        if llm is None:
-            return "Erro: Não foi possível configurar nenhum modelo de linguagem. Verifique sua conexão e chave API."
-        
-        # Recrie os agentes com o novo modelo usando fallback
+        if response is None:
+            return "Erro: Não foi possível configurar nenhum modelo de linguagem. Verifique sua conexão e chave API.", False
+        return response, False
+
+    def _answer_per_file(self, query, llm, available_model, on_partial=None, hedge_model=None):
+        """Answer with one pandas agent per relevant file; returns (response, complete, answered)"""
+        # Reaproveita os agentes em cache; recria apenas os de arquivos/modelos novos
         temp_agents = {}
         agent_types = {}
         
-        for file, df in self.dataframes.items():
+        # Snapshot: um upload concorrente pode recarregar os dataframes durante a consulta
+        snapshot = [(file, df, self.fingerprints.get(file)) for file, df in list(self.dataframes.items())]
+        # Consulta apenas os arquivos mais relevantes para a pergunta
+        selected = self.file_index.select(query, [file for file, _, _ in snapshot],
+                                          top_k=self.route_top_k, min_relative_score=self.route_min_score)
+        if len(selected) < len(snapshot):
+            print(f"Arquivos selecionados para a pergunta: {selected} (de {len(snapshot)})")
+        snapshot = [entry for entry in snapshot if entry[0] in selected]
+        for file, df, fingerprint in snapshot:
             try:
-                print(f"Criando agente para {file} com {len(df)} linhas")
-                agent, agent_type = self.create_agent_with_fallback(llm, df, file)
+                agent, agent_type = self.agent_cache.get_agent(
+                    available_model, file, fingerprint,
+                    lambda: self.create_agent_with_fallback(llm, df, file, model=available_model))
                 temp_agents[file] = agent
                 agent_types[file] = agent_type
-                print(f"Agente ({agent_type}) criado com sucesso para {file}")
             except Exception as e:
                 print(f"Erro ao criar agente para {file}: {e}")
-                return f"Erro ao criar agente para {file}: {str(e)}"
-            
-        # Try to answer using all loaded CSVs with retry logic
-        results = {}
-        errors = []
+                return f"Erro ao criar agente para {file}: {str(e)}", False, False
         
-        # Primeiro, colete todas as respostas usando retry
-        for file, agent in temp_agents.items():
-            try:
-                print(f"Processando arquivo: {file} (tipo: {agent_types[file]})")
-                result = self.execute_query_with_retry(agent, query, file)
-                results[file] = result
-                print(f"Sucesso ao processar {file}")
-            except Exception as e:
-                # Log more detailed error information
-                error_type = type(e).__name__
-                error_details = str(e)
-                print(f"Erro detalhado ao processar {file}: {error_type} - {error_details}")
-                print(f"Traceback completo: {traceback.format_exc()}")
-                
-                # Check for specific error types
-                if "rate limit" in error_details.lower() or "429" in error_details:
-                    errors.append(f"Erro ao processar {file}: Limite de requisições excedido")
-                elif "authentication" in error_details.lower() or "401" in error_details:
-                    errors.append(f"Erro ao processar {file}: Problema de autenticação")
-                elif "timeout" in error_details.lower():
-                    errors.append(f"Erro ao processar {file}: Timeout na requisição")
-                elif "404" in error_details or "not found" in error_details.lower():
-                    errors.append(f"Erro ao processar {file}: Modelo não encontrado ou não disponível")
-                elif "endpoints" in error_details.lower():
-                    errors.append(f"Erro ao processar {file}: Modelo temporariamente indisponível")
-                elif "Could not parse LLM output" in error_details:
-                    errors.append(f"Erro ao processar {file}: Problema de parsing na resposta do modelo")
-                else:
-                    errors.append(f"Erro ao processar {file}: {error_type} - {error_details}")
+        hedge = None
+        if hedge_model is not None:
+            frames = {file: (df, fingerprint) for file, df, fingerprint in snapshot}
+
+            def hedge(file):
+                hedge_llm = self.agent_cache.get_llm(hedge_model, lambda: self._create_llm(hedge_model))
+                df, fingerprint = frames[file]
+                agent, _ = self.agent_cache.get_agent(
+                    hedge_model, file, fingerprint,
+                    lambda: self.create_agent_with_fallback(hedge_llm, df, file, model=hedge_model))
+                return agent, hedge_model
+            
+        # Try to answer using all loaded CSVs with retry logic (em paralelo)
+        results, errors, answered_by = self._run_agents_parallel(temp_agents, agent_types, query, on_partial,
+                                                                 model=available_model, hedge=hedge)
         
         # Se não conseguiu processar nenhum arquivo, retorne os erros
         if not results and errors:
-            return "Não foi possível processar sua consulta:\n" + "\n".join(errors)
+            return "Não foi possível processar sua consulta:\n" + "\n".join(errors), False, False
         
-        # Combina as respostas de forma coerente
-        combined_response = f"Resultado da análise (usando modelo: {available_model}):\n\n"
+        # Combina as respostas de forma coerente, sempre na ordem dos arquivos carregados
+        # Com hedge, alguns arquivos podem ter sido respondidos pelo modelo secundário
+        models_used = ", ".join(dict.fromkeys(answered_by.values()))
+        combined_response = f"Resultado da análise (usando modelo: {models_used}):\n\n"
         for file, response in results.items():
-            combined_response += f"Dados de: {file}\n"
+            if answered_by[file] != available_model:
+                combined_response += f"Dados de: {file} (respondido por {answered_by[file]})\n"
+            else:
+                combined_response += f"Dados de: {file}\n"
             combined_response += f"{response}\n\n"
             
         # Se houver erros, adiciona ao final
         if errors:
             combined_response += "Observações:\n" + "\n".join(errors)
             
-        return combined_response
+        return combined_response, bool(results) and not errors, bool(results)
+
+    def _answer_with_sql(self, query, llm, model, on_partial=None):
+        """Answer with a single SQL agent over all loaded dataframes; returns (response, complete, answered)"""
+        label = "consulta SQL (todas as tabelas)"
+        try:
+            with span('sql_sync'):
+                # Arquivos amostrados entram no SQL completos, lidos em blocos do CSV original
+                sources = {file: summary['path'] for file, summary in list(self.sampled_files.items())}
+                self.sql_engine.sync(dict(self.dataframes), dict(self.fingerprints),
+                                     sources=sources, chunk_rows=self.chunk_rows)
+            agent, agent_type = self.agent_cache.get_agent(
+                model, SQL_AGENT_CACHE_FILE, self.sql_engine.fingerprint(),
+                lambda: (self.sql_engine.create_agent(llm, SQL_AGENT_PROMPT_TEMPLATE, TokenBudget(model)), 'sql'))
+        except Exception as e:
+            print(f"Erro ao preparar o agente SQL: {e}")
+            return f"Erro ao preparar o agente SQL: {str(e)}", False, False
+
+        results, errors, _ = self._run_agents_parallel({label: agent}, {label: agent_type}, query, on_partial,
+                                                       model=model)
+        if not results:
+            return "Não foi possível processar sua consulta:\n" + "\n".join(errors), False, False
+        return f"Resultado da análise (modo SQL, usando modelo: {model}):\n\n{results[label]}\n", True, True
+
+    def _run_agents_parallel(self, agents, agent_types, query, on_partial=None, model=None, hedge=None):
+        """Run the per-file agents on a bounded thread pool with per-file timeouts.
+
+        hedge, when given, is a callable hedge(file) -> (agent, model) used to
+        race a second model against files that take longer than hedge_after.
+        Returns (results, errors, answered_by), answered_by mapping each file to
+        the model whose answer was kept.
+        """
+        results = {}
+        answered_by = {}
+        errors = {}
+        cancel_events = {file: threading.Event() for file in agents}
+        started_at = {}
+
+        def run(file, agent):
+            started_at[file] = time.monotonic()
+            print(f"Processando arquivo: {file} (tipo: {agent_types[file]})")
+            if hedge is not None:
+                return self._hedged_query(agent, query, file, model, hedge, cancel_events[file])
+            return self.execute_query_with_retry(agent, query, file, cancel_event=cancel_events[file], model=model), model
+
+        executor = ThreadPoolExecutor(max_workers=min(self.max_workers, len(agents)) or 1,
+                                      thread_name_prefix="csv-agent")
+        try:
+            futures = {submit_in_context(executor, run, file, agent): file for file, agent in agents.items()}
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+                for future in done:
+                    file = futures[future]
+                    try:
+                        results[file], answered_by[file] = future.result()
+                        print(f"Sucesso ao processar {file}")
+                    except Exception as e:
+                        errors[file] = self._describe_error(file, e)
+                    self._notify_partial(on_partial, file, results, errors)
+
+                # Abandona arquivos que estouraram o tempo limite
+                now = time.monotonic()
+                for future in list(pending):
+                    file = futures[future]
+                    if file in started_at and now - started_at[file] > self.file_timeout:
+                        cancel_events[file].set()
+                        future.cancel()
+                        pending.discard(future)
+                        timeout_error = FileQueryTimeout(f"timeout após {self.file_timeout:g}s")
+                        self._record_model_outcome(model, error=timeout_error)
+                        errors[file] = self._describe_error(file, timeout_error)
+                        self._notify_partial(on_partial, file, results, errors)
+        finally:
+            # Não espera pelos agentes abandonados; cancela os que ainda não começaram
+            for event in cancel_events.values():
+                event.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        # Mescla em ordem fixa (a ordem de carregamento dos arquivos)
+        ordered_results = {file: results[file] for file in agents if file in results}
+        ordered_errors = [errors[file] for file in agents if file in errors]
+        return ordered_results, ordered_errors, {file: answered_by[file] for file in ordered_results}
+
+    def _hedged_query(self, agent, query, file, model, hedge, cancel_event):
+        """Run the query on the primary model; after hedge_after seconds also race it on a backup model.
+
+        Returns (answer, model) with the model whose answer won.
+        """
+        hedge_cancel = threading.Event()
+        pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="csv-agent-hedge")
+        try:
+            primary = submit_in_context(pool, self.execute_query_with_retry, agent, query, file,
+                                        cancel_event=cancel_event, model=model)
+            try:
+                return primary.result(timeout=self.hedge_after), model
+            except FuturesTimeout:
+                pass
+            hedge_agent, hedge_model = hedge(file)
+            print(f"{file} sem resposta após {self.hedge_after:g}s; disparando em paralelo com {hedge_model}")
+            secondary = submit_in_context(pool, self.execute_query_with_retry, hedge_agent, query,
+                                          f"{file} [{hedge_model}]", cancel_event=hedge_cancel, model=hedge_model)
+            models = {primary: model, secondary: hedge_model}
+            pending, first_error = {primary, secondary}, None
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        return future.result(), models[future]
+                    first_error = first_error or future.exception()
+            raise first_error
+        finally:
+            hedge_cancel.set()
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _notify_partial(self, on_partial, file, results, errors):
+        if on_partial is None:
+            return
+        try:
+            if file in results:
+                on_partial(file, results[file], True)
+            else:
+                on_partial(file, errors[file], False)
+        except Exception as e:
+            # Falha ao publicar um parcial não deve derrubar a consulta
+            print(f"Erro ao publicar resultado parcial de {file}: {e}")
+
+    def _describe_error(self, file, e):
+        """Translate an agent exception into a user-facing error line"""
+        # Log more detailed error information
+        error_type = type(e).__name__
+        error_details = str(e)
+        print(f"Erro ao processar {file}: {error_type} - {error_details[:300]}")
+        metrics.inc('file_errors_total', kind=classify_error(e))
+        # Traceback completo apenas em modo de depuração
+        if self.debug and not isinstance(e, FileQueryTimeout):
+            print(''.join(traceback.format_exception(type(e), e, e.__traceback__)))
+        
+        # Check for specific error types
+        kind = classify_error(e)
+        if isinstance(e, FileQueryTimeout):
+            return f"Erro ao processar {file}: Tempo limite excedido ({error_details})"
+        elif kind == 'parse':
+            return f"Erro ao processar {file}: Problema de parsing na resposta do modelo"
+        elif kind == 'rate_limit':
+            return f"Erro ao processar {file}: Limite de requisições excedido"
+        elif kind == 'auth':
+            return f"Erro ao processar {file}: Problema de autenticação"
+        elif kind == 'timeout':
+            return f"Erro ao processar {file}: Timeout na requisição"
+        elif kind == 'not_found':
+            return f"Erro ao processar {file}: Modelo não encontrado ou não disponível"
+        elif kind in ('unavailable', 'server_error'):
+            return f"Erro ao processar {file}: Modelo temporariamente indisponível"
+        elif kind == 'connection':
+            return f"Erro ao processar {file}: Falha de conexão com o provedor do modelo"
+        else:
+            return f"Erro ao processar {file}: {error_type} - {error_details}"
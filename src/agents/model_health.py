@@ -0,0 +1,160 @@
+import re
+import statistics
+import threading
+import time
+from collections import deque, Counter
+
+DEFAULT_FAILURE_THRESHOLD = 3
+DEFAULT_COOLDOWN_SECONDS = 120
+LATENCY_WINDOW = 100
+
+# Erros que indicam que o modelo em si está indisponível: abrem o circuito imediatamente.
+# Falhas de conexão ('connection') e erros 5xx ('server_error') podem ser da rede ou passageiros:
+# contam para failure_threshold como os demais
+MODEL_DOWN_ERRORS = ('rate_limit', 'not_found', 'unavailable')
+
+
+# Classes de exceção do SDK da OpenAI (usado pelo langchain-openai) e o tipo de erro correspondente
+ERROR_CLASS_NAMES = {
+    'RateLimitError': 'rate_limit',
+    'NotFoundError': 'not_found',
+    'AuthenticationError': 'auth',
+    'PermissionDeniedError': 'auth',
+    'APITimeoutError': 'timeout',
+    'FileQueryTimeout': 'timeout',
+    'TimeoutError': 'timeout',
+    'InternalServerError': 'server_error',
+    'APIConnectionError': 'connection',
+    'OutputParserException': 'parse',
+}
+STATUS_CODES = {429: 'rate_limit', 404: 'not_found', 401: 'auth', 403: 'auth',
+                408: 'timeout', 500: 'server_error', 502: 'server_error', 503: 'server_error'}
+# Código HTTP como o SDK o apresenta ("Error code: 429"), nunca um número solto no texto
+STATUS_IN_MESSAGE = re.compile(r'\b(?:error code|status code|status)[:=\s]+(\d{3})\b', re.IGNORECASE)
+
+
+def _status_code(error):
+    for candidate in (error, getattr(error, 'response', None)):
+        code = getattr(candidate, 'status_code', None)
+        if isinstance(code, int):
+            return code
+    return None
+
+
+def classify_error(error):
+    """Map an exception to a coarse error class.
+
+    Parse errors are checked first: their message carries the raw model output,
+    which may contain any number (e.g. "1404 notas") and must not be read as an
+    HTTP status. Otherwise the exception type and status code decide, with the
+    SDK's "Error code: NNN" message and a few fixed phrases as fallback.
+    """
+    details = str(error)
+    if 'Could not parse LLM output' in details or 'Parsing LLM output produced' in details:
+        return 'parse'
+    # OpenRouter sem provedor para o modelo: o modelo está fora do ar, qualquer que seja o código
+    if 'no endpoints found' in details.lower():
+        return 'unavailable'
+    for cls in type(error).__mro__:
+        if cls.__name__ in ERROR_CLASS_NAMES:
+            return ERROR_CLASS_NAMES[cls.__name__]
+    code = _status_code(error)
+    if code is None:
+        match = STATUS_IN_MESSAGE.search(details)
+        code = int(match.group(1)) if match else None
+    if code in STATUS_CODES:
+        return STATUS_CODES[code]
+    lowered = details.lower()
+    if 'rate limit' in lowered or 'rate-limit' in lowered:
+        return 'rate_limit'
+    if 'timed out' in lowered or 'timeout' in lowered:
+        return 'timeout'
+    return 'other'
+
+
+class ModelHealth:
+    """Rolling latency window, error counters and circuit-breaker state of one model"""
+
+    def __init__(self):
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.errors = Counter()
+        self.successes = 0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+
+    def percentile(self, pct):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+
+class ModelHealthRegistry:
+    """Tracks per-model latency and errors and routes queries to the fastest healthy model"""
+
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD, cooldown_seconds=DEFAULT_COOLDOWN_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def _get(self, model):
+        if model not in self._models:
+            self._models[model] = ModelHealth()
+        return self._models[model]
+
+    def record_success(self, model, latency):
+        with self._lock:
+            health = self._get(model)
+            health.latencies.append(latency)
+            health.successes += 1
+            health.consecutive_failures = 0
+            health.open_until = 0.0
+
+    def record_failure(self, model, error_class):
+        with self._lock:
+            health = self._get(model)
+            health.errors[error_class] += 1
+            if error_class in ('parse', 'auth'):
+                # Falha de parsing é do prompt/resposta e de autenticação é da chave, não do modelo
+                return
+            health.consecutive_failures += 1
+            if error_class in MODEL_DOWN_ERRORS or health.consecutive_failures >= self.failure_threshold:
+                health.open_until = time.time() + self.cooldown_seconds
+                print(f"Circuito aberto para {model} por {self.cooldown_seconds:g}s ({error_class})")
+
+    def is_available(self, model):
+        """Closed circuit, or open circuit whose cooldown expired (half-open: one more try allowed)"""
+        with self._lock:
+            health = self._models.get(model)
+            return health is None or time.time() >= health.open_until
+
+    def rank(self, candidates):
+        """Healthy candidates (deduplicated), fastest median latency first.
+
+        Models without measurements get the median of the known medians, so
+        they keep their relative priority instead of always going first or last.
+        """
+        unique = [m for i, m in enumerate(candidates) if m and m not in candidates[:i]]
+        healthy = [m for m in unique if self.is_available(m)]
+        with self._lock:
+            medians = {m: self._models[m].percentile(50) for m in healthy if m in self._models}
+        known = [v for v in medians.values() if v is not None]
+        neutral = statistics.median(known) if known else 0.0
+        return sorted(healthy, key=lambda m: medians.get(m) if medians.get(m) is not None else neutral)
+
+    def snapshot(self):
+        """Per-model stats: latency percentiles, error counts and circuit state"""
+        now = time.time()
+        with self._lock:
+            return {
+                model: {
+                    'p50': health.percentile(50),
+                    'p95': health.percentile(95),
+                    'successes': health.successes,
+                    'errors': dict(health.errors),
+                    'circuit_open': now < health.open_until,
+                }
+                for model, health in self._models.items()
+            }
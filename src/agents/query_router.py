@@ -0,0 +1,153 @@
+import re
+
+import pandas as pd
+
+from utils.chunked_reader import chunked_aggregate
+from utils.text_utils import normalize_text, fix_mojibake
+
+# Palavras que indicam cada operação (português e inglês, já normalizadas)
+ROW_WORDS = {'linhas', 'linha', 'registros', 'registro', 'rows', 'row', 'records', 'entries'}
+COUNT_WORDS = {'quantas', 'quantos', 'numero', 'how', 'many', 'count', 'contagem', 'total', 'quantidade'}
+COLUMN_WORDS = {'colunas', 'columns', 'campos', 'fields', 'cabecalhos', 'headers'}
+AGGREGATE_WORDS = {
+    'media': 'mean', 'average': 'mean', 'mean': 'mean', 'avg': 'mean',
+    'soma': 'sum', 'somatorio': 'sum', 'sum': 'sum', 'total': 'sum',
+    'maximo': 'max', 'maxima': 'max', 'max': 'max', 'maior': 'max', 'highest': 'max', 'largest': 'max', 'maximum': 'max',
+    'minimo': 'min', 'minima': 'min', 'min': 'min', 'menor': 'min', 'lowest': 'min', 'smallest': 'min', 'minimum': 'min',
+}
+GROUP_WORDS = ('por', 'by', 'per', 'cada', 'each')
+
+# Palavras de ligação aceitas; qualquer outra palavra faz a pergunta seguir para o agente
+FILLER_WORDS = {
+    'qual', 'quais', 'e', 'o', 'a', 'os', 'as', 'de', 'do', 'da', 'dos', 'das', 'no', 'na', 'nos', 'nas', 'em',
+    'um', 'uma', 'ha', 'existem', 'tem', 'temos', 'possui', 'sao', 'me', 'mostre', 'liste', 'listar', 'informe',
+    'diga', 'calcule', 'valor', 'valores', 'coluna', 'dados', 'arquivo', 'arquivos', 'tabela', 'csv', 'todos',
+    'todas', 'para', 'cada', 'geral', 'the', 'of', 'what', 'which', 'is', 'are', 'there', 'in', 'for', 'show',
+    'list', 'give', 'tell', 'me', 'calculate', 'value', 'values', 'column', 'data', 'file', 'files', 'table',
+    'dataset', 'all', 'do', 'does', 'have', 'has', 'much', 'by', 'per', 'each', 'por',
+}
+
+MAX_GROUPS_SHOWN = 20
+
+
+def format_number(value):
+    """Format a number in Brazilian style (dots for thousands, comma for decimals)"""
+    if pd.isna(value):
+        return "-"
+    if float(value).is_integer():
+        text = f"{int(value):,}"
+    else:
+        text = f"{float(value):,.2f}"
+    return text.replace(',', '_').replace('.', ',').replace('_', '.')
+
+
+class QueryRouter:
+    """Answers simple aggregate questions directly with pandas; everything else goes to the agent"""
+
+    def __init__(self, dataframes, sampled_files=None):
+        self.dataframes = dataframes
+        self.sampled_files = sampled_files if sampled_files is not None else {}
+
+    def try_answer(self, question):
+        """Return a deterministic answer for simple questions, or None to use the LLM agent"""
+        text = normalize_text(question)
+        tokens = set(text.split())
+        if not tokens or not self.dataframes:
+            return None
+
+        has_aggregate = bool(tokens & AGGREGATE_WORDS.keys())
+        if tokens & ROW_WORDS and tokens & COUNT_WORDS:
+            return self._count_rows(tokens)
+        if tokens & COLUMN_WORDS and not has_aggregate:
+            return self._list_columns(tokens)
+        if has_aggregate:
+            return self._aggregate(text)
+        return None
+
+    def _only_filler(self, tokens, allowed):
+        return tokens <= (FILLER_WORDS | allowed)
+
+    def _count_rows(self, tokens):
+        if not self._only_filler(tokens, ROW_WORDS | COUNT_WORDS):
+            return None
+        lines = []
+        for file, df in list(self.dataframes.items()):
+            rows = self.sampled_files[file]['rows'] if file in self.sampled_files else len(df)
+            lines.append(f"Dados de: {file}\nO arquivo possui {format_number(rows)} linhas.")
+        return "\n\n".join(lines)
+
+    def _list_columns(self, tokens):
+        if not self._only_filler(tokens, COLUMN_WORDS):
+            return None
+        lines = []
+        for file, df in list(self.dataframes.items()):
+            columns = "\n".join(f"- {fix_mojibake(col)} ({df[col].dtype})" for col in df.columns)
+            lines.append(f"Dados de: {file}\nO arquivo possui {len(df.columns)} colunas:\n{columns}")
+        return "\n\n".join(lines)
+
+    def _match_column(self, text, df, numeric=False):
+        """Longest column of df whose normalized name appears in text; returns (column, normalized_name)"""
+        best = None
+        for col in df.columns:
+            if numeric and not (pd.api.types.is_numeric_dtype(df[col]) and not pd.api.types.is_bool_dtype(df[col])):
+                continue
+            name = normalize_text(fix_mojibake(col))
+            if name and f" {name} " in f" {text} " and (best is None or len(name) > len(best[1])):
+                best = (col, name)
+        return best
+
+    @staticmethod
+    def _without(text, name):
+        """text with the first occurrence of the (normalized) column name removed"""
+        return f" {text} ".replace(f" {name} ", " ", 1).strip()
+
+    def _aggregate(self, text):
+        # Separa "média de X por Y" em parte da métrica e parte do agrupamento
+        split = re.split(r'\b(?:' + '|'.join(GROUP_WORDS) + r')\b', text, maxsplit=1)
+        metric_text = split[0]
+        group_text = split[1] if len(split) > 1 else ''
+
+        lines = []
+        for file, df in list(self.dataframes.items()):
+            target = self._match_column(metric_text, df, numeric=True)
+            if target is None:
+                continue
+            group = self._match_column(group_text, df) if group_text else None
+            if group_text and group is None:
+                return None
+            # A operação vem do que sobra sem os nomes das colunas ("VALOR TOTAL máximo" é max, não sum)
+            rest = self._without(text, target[1])
+            if group:
+                rest = self._without(rest, group[1])
+            rest_tokens = set(rest.split())
+            operations = {AGGREGATE_WORDS[t] for t in rest_tokens if t in AGGREGATE_WORDS}
+            if len(operations) != 1 or not self._only_filler(rest_tokens, set(AGGREGATE_WORDS)):
+                return None
+            operation = operations.pop()
+            lines.append(self._compute(file, df, target[0], operation, group[0] if group else None))
+
+        return "\n\n".join(lines) if lines else None
+
+    def _compute(self, file, df, column, operation, group):
+        label = fix_mojibake(column)
+        names = {'mean': 'a média', 'sum': 'a soma', 'max': 'o valor máximo', 'min': 'o valor mínimo'}
+        summary = self.sampled_files.get(file)
+        if group is None:
+            if summary:
+                # Arquivos amostrados: usa as estatísticas exatas calculadas na leitura em blocos
+                value = summary['columns'].get(column, {}).get(operation)
+            else:
+                value = getattr(df[column], operation)()
+            return f"Dados de: {file}\n{names[operation].capitalize()} de {label} é {format_number(value)}."
+
+        if summary:
+            values = chunked_aggregate(summary['path'], column, operation, by=group)
+        else:
+            values = getattr(df.groupby(group, observed=True)[column], operation)()
+        values = values.sort_values(ascending=False)
+        body = "\n".join(f"- {fix_mojibake(key)}: {format_number(value)}"
+                         for key, value in values.head(MAX_GROUPS_SHOWN).items())
+        if len(values) > MAX_GROUPS_SHOWN:
+            body += f"\n... e mais {len(values) - MAX_GROUPS_SHOWN} grupos"
+        return (f"Dados de: {file}\n{names[operation].capitalize()} de {label} por "
+                f"{fix_mojibake(group)} ({len(values)} grupos, em ordem decrescente):\n{body}")
@@ -0,0 +1,143 @@
+import hashlib
+import os
+import re
+import threading
+
+import pandas as pd
+from sqlalchemy import create_engine, event
+from langchain_community.agent_toolkits import create_sql_agent, SQLDatabaseToolkit
+from langchain_community.utilities import SQLDatabase
+
+from utils.text_utils import normalize_text, fix_mojibake
+from utils.chunked_reader import iter_csv_chunks, DEFAULT_CHUNK_ROWS
+
+# Chave usada no cache de agentes para o agente SQL único
+SQL_AGENT_CACHE_FILE = '__sql__'
+# Janela de contexto (tokens) até a qual o esquema vai sem linhas de exemplo
+SMALL_CONTEXT_WINDOW = 8_192
+# Arquivo do banco (em data/.cache/) e tabela com o fingerprint de cada tabela construída
+SQL_DB_NAME = 'tabelas.sqlite'
+META_TABLE = '_csv_agent_tabelas'
+# Segundos de espera quando outro processo está gravando no banco
+SQL_BUSY_TIMEOUT = 60
+
+
+def table_name(file):
+    """SQL-friendly table name for a CSV file (e.g. '202401_NFs_Itens.csv' -> 't_202401_nfs_itens')"""
+    name = re.sub(r'\W+', '_', normalize_text(file.rsplit('.', 1)[0])).strip('_') or 'tabela'
+    return f"t_{name}" if name[0].isdigit() else name
+
+
+def column_names(columns):
+    """SQL-friendly, unique column names (accents repaired and stripped, spaces -> underscores)"""
+    names = []
+    for col in columns:
+        base = re.sub(r'\W+', '_', normalize_text(fix_mojibake(col))).strip('_') or 'coluna'
+        name, suffix = base, 2
+        while name in names:
+            name, suffix = f"{base}_{suffix}", suffix + 1
+        names.append(name)
+    return names
+
+
+class SqlEngine:
+    """SQLite database with one table per loaded dataframe, stored in a file under data/.cache/.
+
+    The database is file-backed so that large CSVs (which the per-file mode only
+    keeps as a sample) do not have to fit in memory, and each table is built
+    once per content fingerprint, also across restarts. In WAL mode, readers
+    (the agents' queries, each on its own connection) keep seeing the previous
+    version of a table while sync rebuilds it; the new version is swapped in
+    when the transaction commits.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.engine = create_engine(f"sqlite:///{db_path}",
+                                    connect_args={'check_same_thread': False, 'timeout': SQL_BUSY_TIMEOUT})
+        event.listen(self.engine, 'connect', self._on_connect)
+        # pysqlite só abre transação antes de INSERT/UPDATE; BEGIN explícito inclui o DDL na transação
+        event.listen(self.engine, 'begin', lambda conn: conn.exec_driver_sql('BEGIN'))
+        self.tables = {}  # arquivo -> (tabela, fingerprint)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _on_connect(dbapi_connection, _):
+        dbapi_connection.isolation_level = None
+        dbapi_connection.execute('PRAGMA journal_mode=WAL')
+
+    def sync(self, dataframes, fingerprints, sources=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+        """Register new/changed dataframes as tables and drop tables of removed files.
+
+        sources maps files whose dataframe is only a sample (large CSVs) to the
+        path of the full CSV; those tables are loaded from the file in chunks,
+        so SQL aggregates see every row.
+        """
+        sources = sources or {}
+        with self._lock:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            with self.engine.begin() as conn:
+                conn.exec_driver_sql(f'CREATE TABLE IF NOT EXISTS "{META_TABLE}" '
+                                     '(file TEXT PRIMARY KEY, tbl TEXT, fingerprint TEXT)')
+                # Tabelas já construídas (por este ou outro processo) são reaproveitadas
+                self.tables = {file: (table, fingerprint) for file, table, fingerprint
+                               in conn.exec_driver_sql(f'SELECT file, tbl, fingerprint FROM "{META_TABLE}"')}
+            for file in [f for f in self.tables if f not in dataframes]:
+                table, _ = self.tables.pop(file)
+                with self.engine.begin() as conn:
+                    conn.exec_driver_sql(f'DROP TABLE IF EXISTS "{table}"')
+                    conn.exec_driver_sql(f'DELETE FROM "{META_TABLE}" WHERE file = ?', (file,))
+            for file, df in list(dataframes.items()):
+                fingerprint = fingerprints.get(file)
+                if file in self.tables and self.tables[file][1] == fingerprint:
+                    continue
+                table = table_name(file)
+                with self.engine.begin() as conn:
+                    # Carrega em uma tabela nova e troca no commit: quem consulta nunca vê a tabela pela metade
+                    staging = f"{table}__carga"
+                    conn.exec_driver_sql(f'DROP TABLE IF EXISTS "{staging}"')
+                    if file in sources:
+                        rows = 0
+                        for chunk in iter_csv_chunks(sources[file], chunk_rows):
+                            self._to_sql(chunk, staging, conn, if_exists='append')
+                            rows += len(chunk)
+                        if rows == 0:
+                            self._to_sql(df.head(0), staging, conn)
+                    else:
+                        rows = len(df)
+                        self._to_sql(df, staging, conn)
+                    conn.exec_driver_sql(f'DROP TABLE IF EXISTS "{table}"')
+                    conn.exec_driver_sql(f'ALTER TABLE "{staging}" RENAME TO "{table}"')
+                    conn.exec_driver_sql(f'INSERT OR REPLACE INTO "{META_TABLE}" VALUES (?, ?, ?)',
+                                         (file, table, fingerprint))
+                self.tables[file] = (table, fingerprint)
+                print(f"Tabela SQL '{table}' registrada para {file} ({rows} linhas)")
+
+    def _to_sql(self, df, table, conn, if_exists='replace'):
+        df = df.copy()
+        df.columns = column_names(df.columns)
+        for col in df.columns:
+            series = df[col]
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                df[col] = series.astype(object)
+            # Inteiros gigantes (ex.: chaves de NF-e) e colunas mistas não cabem no SQLite como número
+            elif series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) != 'string':
+                df[col] = series.map(lambda v: v if pd.isna(v) else str(v))
+            if df[col].dtype == object or pd.api.types.is_string_dtype(df[col]):
+                df[col] = df[col].map(lambda v: v if pd.isna(v) else fix_mojibake(v))
+        df.to_sql(table, conn, if_exists=if_exists, index=False, chunksize=10_000)
+
+    def fingerprint(self):
+        """Combined fingerprint of all registered tables (used as the agent cache key)"""
+        payload = repr(sorted((table, fp) for table, fp in self.tables.values()))
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def create_agent(self, llm, prefix, budget=None):
+        # Modelos com janela pequena: esquema sem linhas de exemplo e saídas das ferramentas limitadas
+        sample_rows = 3 if budget is None or budget.window > SMALL_CONTEXT_WINDOW else 0
+        db = SQLDatabase(self.engine, sample_rows_in_table_info=sample_rows, ignore_tables=[META_TABLE])
+        toolkit = SQLDatabaseToolkit(db=db, llm=llm)
+        agent = create_sql_agent(llm, toolkit=toolkit, prefix=prefix, verbose=False)
+        if budget is not None:
+            agent.tools = budget.cap_tools(agent.tools)
+        return agent
@@ -1,5 +1,9 @@
+import argparse
+import os
 import sys
 from agents.csv_agent import CsvAgent
+from agents.batch_runner import BatchRunner, read_questions, DEFAULT_BATCH_CONCURRENCY
+from utils.rate_limiter import RateLimiter
 
 def prompt_user(csv_agent):
     try:
@@ -11,7 +15,38 @@ def prompt_user(csv_agent):
         print('\nExiting CSV Query Agent.')
         sys.exit(0)
 
+def run_batch(args):
+    questions = read_questions(args.questions)
+    if not questions:
+        print(f'No questions found in {args.questions}.')
+        sys.exit(1)
+    csv_agent = CsvAgent()
+    if args.rpm:
+        csv_agent.rate_limiter = RateLimiter(args.rpm)
+    runner = BatchRunner(csv_agent, model=args.model, mode=args.mode, concurrency=args.concurrency)
+    summary = runner.run(questions, args.output, resume=args.resume)
+    sys.exit(1 if summary['errors'] else 0)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='CSV Query Agent')
+    subparsers = parser.add_subparsers(dest='command')
+    batch = subparsers.add_parser('batch', help='answer a file of questions and write the results as JSONL')
+    batch.add_argument('questions', help='.txt (one question per line), .json (list) or .jsonl file')
+    batch.add_argument('-o', '--output', default='resultados.jsonl', help='JSONL output file')
+    batch.add_argument('--model', help='model to use (default: fastest healthy model)')
+    batch.add_argument('--mode', choices=('per_file', 'sql'), help='query mode')
+    batch.add_argument('--concurrency', type=int,
+                       default=int(os.environ.get('CSV_AGENT_BATCH_CONCURRENCY', DEFAULT_BATCH_CONCURRENCY)),
+                       help='questions answered in parallel')
+    batch.add_argument('--rpm', type=float, help='maximum agent runs per minute (model rate limit)')
+    batch.add_argument('--resume', action='store_true', help='skip questions already answered in the output file')
+    return parser.parse_args(argv)
+
 def main():
+    args = parse_args()
+    if args.command == 'batch':
+        run_batch(args)
+        return
     print('Welcome to the CSV Query Agent!')
     csv_agent = CsvAgent()
     prompt_user(csv_agent)
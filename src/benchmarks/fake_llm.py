@@ -0,0 +1,51 @@
+import re
+import threading
+import time
+from typing import Any, List, Optional
+
+from langchain_core.language_models.llms import LLM
+
+# Primeira ação de cada tipo de agente: pandas (python_repl_ast) ou SQL (sql_db_*)
+PANDAS_ACTION = "Thought: Vou contar as linhas do dataframe.\nAction: python_repl_ast\nAction Input: len(df)"
+SQL_ACTION = "Thought: Vou listar as tabelas disponíveis.\nAction: sql_db_list_tables\nAction Input: "
+
+
+class FakeLLM(LLM):
+    """Deterministic local stand-in for the OpenRouter LLM, with configurable latency.
+
+    Plays one ReAct round (one tool call, then a final answer echoing the last
+    observation), so agent parsing and tool execution are exercised without
+    network access.
+    """
+
+    model: str = "fake"
+    latency: float = 0.0
+    calls: int = 0
+    _lock: Any = None
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._lock = threading.Lock()
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-benchmark"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        with self._lock:
+            self.calls += 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+        # Só o histórico após a pergunta conta (as instruções do prompt também citam "Observation:")
+        scratchpad = prompt.rsplit("Question:", 1)[-1]
+        observations = re.findall(r"Observation:\s*(.*)", scratchpad)
+        if observations:
+            return f"Thought: I now know the final answer\nFinal Answer: {observations[-1].strip()[:200]}"
+        if "sql_db_list_tables" in prompt:
+            return SQL_ACTION
+        return PANDAS_ACTION
+
+
+def fake_llm_factory(latency=0.0):
+    """LLM factory for CsvAgent(llm_factory=...): one FakeLLM per model"""
+    return lambda model: FakeLLM(model=model, latency=latency)
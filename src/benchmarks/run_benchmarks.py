@@ -0,0 +1,243 @@
+"""Offline benchmark of the query pipeline (CsvAgent, CLI flow and Flask routes).
+
+Usage (from src/):
+    python -m benchmarks.run_benchmarks --files 3 --rows 200000 --latency 0.05
+
+Generates synthetic CSVs, replaces OpenRouter with a local fake LLM and writes
+a JSON report (load time, peak memory, agent construction, per-query latency
+and throughput) to benchmarks/reports/.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fake_llm import fake_llm_factory
+from benchmarks.synthetic_data import generate_csvs
+
+REPORTS_DIR = os.path.join(os.path.dirname(__file__), 'reports')
+BENCH_MODEL = 'benchmark/fake-llm'
+
+# Perguntas de exemplo: as duas primeiras caem no caminho rápido, as demais usam o agente
+QUESTIONS = [
+    "Quantas linhas tem cada arquivo?",
+    "Qual a soma de VALOR 1 por UF EMITENTE?",
+    "Quais categorias aparecem com mais frequência na coluna CATEGORIA 1?",
+    "Existe alguma tendência de VALOR 2 ao longo de DATA EMISSÃO?",
+    "Compare a distribuição de VALOR 3 entre SP e RJ",
+]
+
+
+def summarize(latencies, wall_time=None):
+    """count/mean/p50/p95/max in seconds, plus throughput when the wall time is known"""
+    if not latencies:
+        return {'count': 0}
+    ordered = sorted(latencies)
+    stats = {
+        'count': len(ordered),
+        'mean_s': statistics.fmean(ordered),
+        'p50_s': ordered[int(0.50 * (len(ordered) - 1))],
+        'p95_s': ordered[int(round(0.95 * (len(ordered) - 1)))],
+        'max_s': ordered[-1],
+    }
+    if wall_time:
+        stats['wall_s'] = wall_time
+        stats['throughput_qps'] = len(ordered) / wall_time
+    return stats
+
+
+def answer_path(response):
+    text = str(response)
+    if 'resposta direta' in text[:80]:
+        return 'fast_path'
+    if text.startswith('♻️'):
+        return 'answer_cache'
+    if text.startswith('Resultado da análise'):
+        return 'llm'
+    return 'error'
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    # ru_maxrss é em KB no Linux e em bytes no macOS
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+@contextlib.contextmanager
+def quiet(enabled):
+    """Silence the pipeline's progress prints while measuring"""
+    if not enabled:
+        yield
+        return
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def bench_load(data_dir, llm_factory):
+    from agents.csv_agent import CsvAgent
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    agent = CsvAgent(data_dir=data_dir, llm_factory=llm_factory)
+    cold = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # Segunda carga: aproveita o cache colunar gravado na primeira
+    start = time.perf_counter()
+    CsvAgent(data_dir=data_dir, llm_factory=llm_factory)
+    warm = time.perf_counter() - start
+    return agent, {
+        'cold_s': cold,
+        'warm_s': warm,
+        'peak_traced_mb': peak / (1024 * 1024),
+        'dataframes_mb': {file: report.get('after_mb', report.get('before_mb'))
+                          for file, report in agent.memory_report.items()},
+        'rows': {file: len(df) for file, df in agent.dataframes.items()},
+    }
+
+
+def bench_agent_construction(agent):
+    llm = agent._create_llm(BENCH_MODEL)
+    timings = {}
+    for file, df in agent.dataframes.items():
+        start = time.perf_counter()
+        agent.create_agent_with_fallback(llm, df, file, model=BENCH_MODEL)
+        timings[file] = time.perf_counter() - start
+    return {'per_file_s': timings, **summarize(list(timings.values()))}
+
+
+def bench_cli(agent, questions, repeat, mode):
+    """Same flow as app.py: one question at a time through process_query"""
+    latencies, paths = [], {}
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for question in questions:
+            query_start = time.perf_counter()
+            response = agent.process_query(question, BENCH_MODEL, mode=mode)
+            latencies.append(time.perf_counter() - query_start)
+            path = answer_path(response)
+            paths[path] = paths.get(path, 0) + 1
+    return {'paths': paths, **summarize(latencies, time.perf_counter() - start)}
+
+
+def bench_web(llm_factory, questions, repeat, mode, concurrency):
+    """POST /query (synchronous) and /jobs (queue + polling) through the Flask test client"""
+    import web_app
+
+    web_app.csv_agent.llm_factory = llm_factory
+    requests_list = [question for _ in range(repeat) for question in questions]
+
+    def post_query(question):
+        client = web_app.app.test_client()
+        start = time.perf_counter()
+        response = client.post('/query', data={'model': BENCH_MODEL, 'question': question, 'mode': mode})
+        return time.perf_counter() - start, response.status_code
+
+    def post_job(question):
+        client = web_app.app.test_client()
+        start = time.perf_counter()
+        response = client.post('/jobs', data={'model': BENCH_MODEL, 'question': question, 'mode': mode})
+        if response.status_code != 202:
+            return time.perf_counter() - start, response.status_code
+        result_url = response.get_json()['result_url']
+        while True:
+            response = client.get(result_url)
+            if response.status_code != 202:
+                return time.perf_counter() - start, response.status_code
+            time.sleep(0.01)
+
+    report = {}
+    for name, fn in (('query', post_query), ('jobs', post_job)):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = list(pool.map(fn, requests_list))
+        wall = time.perf_counter() - start
+        statuses = {}
+        for _, status in outcomes:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        report[name] = {'status_codes': statuses, **summarize([latency for latency, _ in outcomes], wall)}
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark offline do pipeline de consultas (LLM local simulado)")
+    parser.add_argument('--files', type=int, default=2, help="número de CSVs sintéticos")
+    parser.add_argument('--rows', type=int, default=50_000, help="linhas por CSV")
+    parser.add_argument('--numeric-columns', type=int, default=4)
+    parser.add_argument('--categorical-columns', type=int, default=3)
+    parser.add_argument('--categories', type=int, default=20, help="valores distintos por coluna categórica")
+    parser.add_argument('--latency', type=float, default=0.05, help="latência simulada por chamada ao LLM (s)")
+    parser.add_argument('--repeat', type=int, default=3, help="repetições do conjunto de perguntas")
+    parser.add_argument('--concurrency', type=int, default=4, help="requisições simultâneas nas rotas Flask")
+    parser.add_argument('--mode', choices=('per_file', 'sql'), default='per_file')
+    parser.add_argument('--answer-cache', action='store_true', help="mantém o cache de respostas ligado")
+    parser.add_argument('--skip-web', action='store_true', help="não mede as rotas Flask")
+    parser.add_argument('--data-dir', help="diretório para os CSVs (padrão: diretório temporário)")
+    parser.add_argument('--output', help="arquivo JSON do relatório (padrão: benchmarks/reports/)")
+    parser.add_argument('--verbose', action='store_true', help="mostra os logs do pipeline")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix='csv-agent-bench-')
+    # Configura o ambiente antes de importar o app Flask (que cria o seu próprio CsvAgent)
+    os.environ['CSV_AGENT_DATA_DIR'] = data_dir
+    if not args.answer_cache:
+        os.environ['CSV_AGENT_ANSWER_CACHE_SIZE'] = '0'
+    llm_factory = fake_llm_factory(args.latency)
+
+    start = time.perf_counter()
+    files = generate_csvs(data_dir, args.files, args.rows, args.numeric_columns,
+                          args.categorical_columns, args.categories)
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': vars(args),
+        'data': {
+            'dir': data_dir,
+            'generation_s': time.perf_counter() - start,
+            'files_mb': {f: os.path.getsize(os.path.join(data_dir, f)) / (1024 * 1024) for f in files},
+        },
+    }
+
+    with quiet(not args.verbose):
+        agent, report['load'] = bench_load(data_dir, llm_factory)
+        report['agent_construction'] = bench_agent_construction(agent)
+        report['cli'] = bench_cli(agent, QUESTIONS, args.repeat, args.mode)
+        if not args.skip_web:
+            report['web'] = bench_web(llm_factory, QUESTIONS, args.repeat, args.mode, args.concurrency)
+    report['peak_rss_mb'] = peak_rss_mb()
+
+    output = args.output or os.path.join(REPORTS_DIR, f"benchmark-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+
+    print(f"Carga: {report['load']['cold_s']:.2f}s (cache colunar: {report['load']['warm_s']:.2f}s), "
+          f"pico {report['load']['peak_traced_mb']:.1f} MB")
+    print(f"CLI: p50 {report['cli']['p50_s']:.3f}s, p95 {report['cli']['p95_s']:.3f}s, "
+          f"{report['cli']['throughput_qps']:.2f} consultas/s")
+    for name, stats in report.get('web', {}).items():
+        print(f"Web /{name}: p50 {stats['p50_s']:.3f}s, p95 {stats['p95_s']:.3f}s, "
+              f"{stats['throughput_qps']:.2f} consultas/s")
+    print(f"Relatório salvo em {output}")
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+UFS = ['SP', 'RJ', 'MG', 'PR', 'RS', 'SC', 'BA', 'PE', 'GO', 'DF']
+
+
+def make_dataframe(rows, numeric_columns=4, categorical_columns=3, categories=20, seed=0):
+    """Synthetic invoice-like dataframe: id, date, UF, categorical and numeric columns"""
+    rng = np.random.default_rng(seed)
+    data = {
+        'NÚMERO': np.arange(1, rows + 1),
+        'DATA EMISSÃO': pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 31 * 86400, rows), unit='s'),
+        'UF EMITENTE': rng.choice(UFS, rows),
+    }
+    for i in range(categorical_columns):
+        labels = np.array([f'CATEGORIA {i + 1}-{j + 1:03d}' for j in range(categories)])
+        data[f'CATEGORIA {i + 1}'] = labels[rng.integers(0, categories, rows)]
+    for i in range(numeric_columns):
+        data[f'VALOR {i + 1}'] = rng.gamma(2.0, 500.0, rows).round(2)
+    return pd.DataFrame(data)
+
+
+def generate_csvs(data_dir, files=2, rows=10_000, numeric_columns=4, categorical_columns=3, categories=20, seed=0):
+    """Write `files` synthetic CSVs (latin-1, like the real exports) to data_dir; returns their names"""
+    os.makedirs(data_dir, exist_ok=True)
+    names = []
+    for index in range(files):
+        df = make_dataframe(rows, numeric_columns, categorical_columns, categories, seed=seed + index)
+        name = f'sintetico_{index + 1:02d}_{rows}x{df.shape[1]}.csv'
+        df.to_csv(os.path.join(data_dir, name), index=False, encoding='latin1')
+        names.append(name)
+    return names
@@ -0,0 +1,46 @@
+"""Fast-path router: run from src/ with `python -m pytest tests`."""
+import pandas as pd
+import pytest
+
+from agents.query_router import QueryRouter
+
+
+@pytest.fixture
+def router():
+    df = pd.DataFrame({
+        'UF EMITENTE': ['SP', 'SP', 'RJ', 'MG'],
+        'VALOR TOTAL': [10.0, 30.0, 330000.0, 5.0],
+        'QUANTIDADE': [1, 2, 3, 4],
+    })
+    return QueryRouter({'itens.csv': df})
+
+
+@pytest.mark.parametrize('question, expected', [
+    ("Qual o VALOR TOTAL máximo?", "O valor máximo de VALOR TOTAL é 330.000."),
+    ("Qual é o VALOR TOTAL mínimo?", "O valor mínimo de VALOR TOTAL é 5."),
+    ("VALOR TOTAL max", "O valor máximo de VALOR TOTAL é 330.000."),
+    ("Qual a soma de VALOR TOTAL?", "A soma de VALOR TOTAL é 330.045."),
+    ("total de VALOR TOTAL", "A soma de VALOR TOTAL é 330.045."),
+    ("Qual a média de QUANTIDADE?", "A média de QUANTIDADE é 2,50."),
+])
+def test_operation_ignores_words_inside_column_names(router, question, expected):
+    assert router.try_answer(question).endswith(expected)
+
+
+def test_grouped_aggregate(router):
+    answer = router.try_answer("Qual a soma de VALOR TOTAL por UF EMITENTE?")
+    assert "por UF EMITENTE (3 grupos" in answer
+    assert "- SP: 40" in answer
+
+
+@pytest.mark.parametrize('question', [
+    "VALOR TOTAL",                       # nenhuma operação fora do nome da coluna
+    "maior e menor VALOR TOTAL",         # mais de uma operação
+    "Qual o VALOR TOTAL máximo em SP?",  # filtro: fica para o agente
+])
+def test_ambiguous_questions_go_to_the_agent(router, question):
+    assert router.try_answer(question) is None
+
+
+def test_count_rows(router):
+    assert router.try_answer("Quantas linhas?").endswith("O arquivo possui 4 linhas.")
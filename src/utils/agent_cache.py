@@ -0,0 +1,74 @@
+import threading
+from collections import OrderedDict
+
+from utils.token_budget import CappedRun
+
+
+class AgentCache:
+    """LRU cache for LLM clients (per model) and agents (per model, file and content fingerprint)"""
+
+    def __init__(self, max_agents=32):
+        self.max_agents = max_agents
+        self._llms = {}
+        self._agents = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get_llm(self, model, factory):
+        """Return the cached LLM client for a model, creating it with factory() on a miss"""
+        with self._lock:
+            llm = self._llms.get(model)
+            if llm is None:
+                llm = factory()
+                self._llms[model] = llm
+            return llm
+
+    def get_agent(self, model, file, fingerprint, factory):
+        """Return the cached (agent, agent_type) for the key, creating it with factory() on a miss"""
+        key = (model, file, fingerprint)
+        with self._lock:
+            if key in self._agents:
+                self._agents.move_to_end(key)
+                return self._agents[key]
+            entry = factory()
+            self._agents[key] = entry
+            while len(self._agents) > self.max_agents:
+                evicted, _ = self._agents.popitem(last=False)
+                print(f"Cache de agentes: removendo entrada antiga {evicted[0]} / {evicted[1]}")
+            return entry
+
+    def invalidate(self, file=None, model=None):
+        """Drop agents for a file and/or model (and the LLM client when a model is given)"""
+        with self._lock:
+            for key in list(self._agents):
+                if (file is None or key[1] == file) and (model is None or key[0] == model):
+                    del self._agents[key]
+            if model is not None and file is None:
+                self._llms.pop(model, None)
+
+    def clear(self):
+        with self._lock:
+            self._agents.clear()
+            self._llms.clear()
+
+    def __len__(self):
+        return len(self._agents)
+
+
+def private_copy(agent):
+    """Copy of a cached agent for a single run.
+
+    The pandas agent's python REPL keeps the variables of a run in one locals
+    dict, so concurrent runs of the same cached agent would overwrite each
+    other's intermediate results. The copy gets REPL tools with their own
+    globals/locals (starting from the cached ones); the LLM chain is shared.
+    """
+    return agent.model_copy(update={'tools': [_private_tool(tool) for tool in agent.tools]})
+
+
+def _private_tool(tool):
+    func = getattr(tool, 'func', None)
+    if isinstance(func, CappedRun):
+        return tool.model_copy(update={'func': CappedRun(_private_tool(func.tool), func.limit)})
+    if isinstance(getattr(tool, 'locals', None), dict):
+        return tool.model_copy(update={'locals': dict(tool.locals), 'globals': dict(tool.globals or {})})
+    return tool
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from utils.text_utils import normalize_text
+
+DEFAULT_TTL_SECONDS = 3600
+DEFAULT_MAX_ENTRIES = 256
+
+
+def normalize_question(question):
+    """Normalize a question so trivially different phrasings share a cache entry.
+
+    Lowercases, strips accents and punctuation and collapses whitespace, so
+    "Qual é o total?" and "qual e o  total" map to the same key.
+    """
+    return normalize_text(question)
+
+
+class AnswerCache:
+    """Answer cache with TTL and LRU eviction, optionally persisted to a SQLite file"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS, db_path=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (answer, created_at)
+        self._lock = threading.Lock()
+        self._db = None
+        if db_path and max_entries > 0:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                "key TEXT PRIMARY KEY, answer TEXT NOT NULL, created_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    @staticmethod
+    def make_key(question, model, fingerprints, mode=''):
+        """Key = normalized question + model + query mode + fingerprints of every loaded dataframe"""
+        payload = json.dumps([normalize_question(question), model or '', mode, sorted(fingerprints.items())])
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def _expired(self, created_at):
+        return self.ttl_seconds > 0 and time.time() - created_at > self.ttl_seconds
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and self._db is not None:
+                row = self._db.execute("SELECT answer, created_at FROM answers WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    entry = (row[0], row[1])
+                    self._entries[key] = entry
+            if entry is None:
+                return None
+            answer, created_at = entry
+            if self._expired(created_at):
+                self._delete(key)
+                return None
+            self._entries.move_to_end(key)
+            if self._db is not None:
+                self._db.execute("UPDATE answers SET last_access = ? WHERE key = ?", (time.time(), key))
+                self._db.commit()
+            self._evict()
+            return answer
+
+    def set(self, key, answer):
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._lock:
+            self._entries[key] = (answer, now)
+            self._entries.move_to_end(key)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?)", (key, answer, now, now))
+            self._evict()
+            if self._db is not None:
+                self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM answers")
+                self._db.commit()
+
+    def _delete(self, key):
+        self._entries.pop(key, None)
+        if self._db is not None:
+            self._db.execute("DELETE FROM answers WHERE key = ?", (key,))
+            self._db.commit()
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        if self._db is not None:
+            # Mantém no disco apenas as entradas acessadas mais recentemente
+            self._db.execute(
+                "DELETE FROM answers WHERE key NOT IN "
+                "(SELECT key FROM answers ORDER BY last_access DESC LIMIT ?)", (self.max_entries,))
+            if self.ttl_seconds > 0:
+                self._db.execute("DELETE FROM answers WHERE created_at < ?", (time.time() - self.ttl_seconds,))
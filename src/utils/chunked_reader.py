@@ -0,0 +1,128 @@
+import numpy as np
+import pandas as pd
+
+# Arquivos acima deste tamanho são lidos em blocos em vez de carregados inteiros
+DEFAULT_STREAM_THRESHOLD_MB = 200
+DEFAULT_CHUNK_ROWS = 100_000
+DEFAULT_SAMPLE_ROWS = 50_000
+
+AGGREGATIONS = ('count', 'sum', 'mean', 'min', 'max')
+NUMERIC_AGGREGATIONS = ('sum', 'mean')
+
+CSV_READ_OPTIONS = {'encoding': 'latin1', 'on_bad_lines': 'skip'}
+
+
+def iter_csv_chunks(path, chunk_rows=DEFAULT_CHUNK_ROWS, usecols=None):
+    """Iterate over a CSV in chunks of chunk_rows rows, with the loader's read options"""
+    return pd.read_csv(path, chunksize=chunk_rows, usecols=usecols, **CSV_READ_OPTIONS)
+
+
+def read_csv_streaming(path, chunk_rows=DEFAULT_CHUNK_ROWS, sample_rows=DEFAULT_SAMPLE_ROWS, seed=0):
+    """Read a large CSV chunk by chunk, keeping a uniform random sample and exact per-column stats.
+
+    Returns (sample_df, summary). The sample keeps the original row order and at
+    most sample_rows rows; summary holds the total row count and, per column,
+    non-null/null counts plus min/max/sum/mean for numeric columns.
+    """
+    rng = np.random.default_rng(seed)
+    sample, sample_keys = None, None
+    total_rows = 0
+    columns = {}
+
+    for chunk in iter_csv_chunks(path, chunk_rows):
+        chunk.index = pd.RangeIndex(total_rows, total_rows + len(chunk))
+        total_rows += len(chunk)
+
+        for col in chunk.columns:
+            series = chunk[col]
+            stats = columns.setdefault(col, {'non_null': 0, 'nulls': 0})
+            stats['non_null'] += int(series.count())
+            stats['nulls'] += int(series.isna().sum())
+            if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+                if series.count():
+                    stats['min'] = min(stats.get('min', np.inf), float(series.min()))
+                    stats['max'] = max(stats.get('max', -np.inf), float(series.max()))
+                    stats['sum'] = stats.get('sum', 0.0) + float(series.sum())
+            else:
+                # Uma coluna que deixa de ser numérica em algum bloco não tem estatísticas numéricas
+                stats['text'] = True
+
+        # Amostragem "bottom-k": cada linha recebe uma chave aleatória e ficam as k menores
+        keys = rng.random(len(chunk))
+        if sample is None:
+            sample, sample_keys = chunk, keys
+        else:
+            sample = pd.concat([sample, chunk])
+            sample_keys = np.concatenate([sample_keys, keys])
+        if len(sample) > sample_rows:
+            keep = np.sort(np.argpartition(sample_keys, sample_rows)[:sample_rows])
+            sample, sample_keys = sample.iloc[keep], sample_keys[keep]
+
+    for stats in columns.values():
+        if stats.pop('text', False):
+            for key in ('min', 'max', 'sum'):
+                stats.pop(key, None)
+        elif 'sum' in stats and stats['non_null']:
+            stats['mean'] = stats['sum'] / stats['non_null']
+
+    if sample is None:
+        sample = pd.read_csv(path, nrows=0, **CSV_READ_OPTIONS)
+    summary = {'path': path, 'rows': total_rows, 'sample_rows': len(sample), 'columns': columns}
+    return sample, summary
+
+
+def chunked_aggregate(path, column, operation, by=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Compute an exact aggregate over the whole file, one chunk at a time.
+
+    operation is one of AGGREGATIONS; by optionally groups by another column.
+    Returns a scalar, or a Series indexed by the group values.
+    """
+    if operation not in AGGREGATIONS:
+        raise ValueError(f"Operação não suportada: {operation}. Use uma de {', '.join(AGGREGATIONS)}")
+    usecols = [column] if by is None else list(dict.fromkeys([column, by]))
+    partials, kinds = [], set()
+    for chunk in iter_csv_chunks(path, chunk_rows, usecols=usecols):
+        numeric = pd.api.types.is_numeric_dtype(chunk[column])
+        # Em colunas de texto, sum concatenaria os valores em vez de somá-los
+        if operation in NUMERIC_AGGREGATIONS and not numeric:
+            raise ValueError(f"A coluna '{column}' não é numérica; a operação {operation} exige valores numéricos")
+        kinds.add(numeric)
+        if operation != 'count' and len(kinds) > 1:
+            raise ValueError(f"A coluna '{column}' mistura valores numéricos e texto; não é possível calcular {operation}")
+        target = chunk.groupby(by, observed=True)[column] if by is not None else chunk[column]
+        if operation == 'mean':
+            partials.append(pd.DataFrame({'sum': target.sum(), 'count': target.count()},
+                                         index=None if by is not None else [0]))
+        else:
+            partials.append(getattr(target, operation)())
+
+    if not partials:
+        return None
+    if by is None:
+        if operation == 'mean':
+            totals = pd.concat(partials).sum()
+            return totals['sum'] / totals['count'] if totals['count'] else None
+        values = pd.Series(partials)
+        return values.sum() if operation in ('count', 'sum') else getattr(values, operation)()
+
+    combined = pd.concat(partials)
+    if operation == 'mean':
+        totals = combined.groupby(level=0).sum()
+        return totals['sum'] / totals['count']
+    reducer = 'sum' if operation in ('count', 'sum') else operation
+    return getattr(combined.groupby(level=0), reducer)()
+
+
+def describe_summary(summary, max_columns=40):
+    """Render a streaming summary as text for the agent prompt"""
+    lines = [f"Total de linhas no arquivo completo: {summary['rows']}",
+             f"Linhas na amostra carregada em df: {summary['sample_rows']}"]
+    for col, stats in list(summary['columns'].items())[:max_columns]:
+        line = f"- {col}: {stats['non_null']} não nulos, {stats['nulls']} nulos"
+        if 'mean' in stats:
+            line += (f", min={stats['min']:.12g}, max={stats['max']:.12g}, "
+                     f"soma={stats['sum']:.12g}, média={stats['mean']:.12g}")
+        lines.append(line)
+    if len(summary['columns']) > max_columns:
+        lines.append(f"... e mais {len(summary['columns']) - max_columns} colunas")
+    return "\n".join(lines)
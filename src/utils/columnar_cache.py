@@ -0,0 +1,91 @@
+import json
+import os
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # pyarrow é opcional: sem ele o cache fica desativado
+    pa = feather = None
+
+CACHE_DIR_NAME = '.cache'
+
+
+def _arrow_string_mapper(arrow_type):
+    if arrow_type in (pa.string(), pa.large_string()):
+        return pd.StringDtype('pyarrow')
+    return None
+
+
+class ColumnarCache:
+    """Sidecar Feather (Arrow IPC) cache of parsed CSVs, validated against the source file hash"""
+
+    def __init__(self, data_dir, enabled=True, zero_copy=False):
+        self.cache_dir = os.path.join(data_dir, CACHE_DIR_NAME)
+        self.enabled = enabled and feather is not None
+        # Dataframes apoiados diretamente nos arquivos mapeados (compartilhados entre processos)
+        self.zero_copy = zero_copy
+        if enabled and feather is None:
+            print("⚠️  pyarrow não instalado: cache colunar de CSVs desativado.")
+
+    def _paths(self, file):
+        base = os.path.join(self.cache_dir, file)
+        return base + '.feather', base + '.meta.json'
+
+    def load(self, file, state):
+        """Return the cached dataframe for file if it matches state (same source hash), else None"""
+        if not self.enabled:
+            return None
+        data_path, meta_path = self._paths(file)
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get('digest') != state.digest:
+                return None
+            # Arquivos sem compressão podem ser mapeados em memória diretamente
+            table = feather.read_table(data_path, memory_map=True)
+            if self.zero_copy:
+                # Um bloco por coluna e textos como strings Arrow: as colunas referenciam o mapeamento
+                df = table.to_pandas(split_blocks=True, types_mapper=_arrow_string_mapper)
+            else:
+                df = table.to_pandas()
+            for col in meta.get('big_int_columns', []):
+                df[col] = df[col].map(lambda v: v if v is None else int(v)).astype(object)
+            return df
+        except (OSError, ValueError):
+            return None
+
+    def store(self, file, state, df):
+        """Write df and its metadata next to the source CSV; failures only disable the cache for this file"""
+        if not self.enabled:
+            return
+        data_path, meta_path = self._paths(file)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Inteiros maiores que 64 bits (ex.: chaves de acesso de NF-e) não cabem no Arrow:
+            # são gravados como texto e convertidos de volta na leitura
+            big_int_columns = [str(col) for col in df.columns
+                               if df[col].dtype == object and pd.api.types.infer_dtype(df[col]) == 'integer']
+            to_write = df.astype({col: str for col in big_int_columns}) if big_int_columns else df
+            feather.write_feather(to_write, data_path + '.tmp', compression='uncompressed')
+            os.replace(data_path + '.tmp', data_path)
+            meta = {
+                'digest': state.digest,
+                'size': state.size,
+                'rows': len(df),
+                'big_int_columns': big_int_columns,
+                'dtypes': {str(col): str(dtype) for col, dtype in df.dtypes.items()},
+            }
+            with open(meta_path, 'w', encoding='utf-8') as f:
+                json.dump(meta, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            # Ex.: colunas com tipos mistos que o Arrow não consegue converter
+            print(f"Não foi possível gravar o cache colunar de {file}: {e}")
+            self.remove(file)
+
+    def remove(self, file):
+        for path in self._paths(file):
+            for candidate in (path, path + '.tmp'):
+                if os.path.exists(candidate):
+                    os.remove(candidate)
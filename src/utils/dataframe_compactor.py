@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+
+# Colunas de texto com proporção de valores distintos abaixo deste limite viram categóricas
+DEFAULT_CATEGORY_RATIO = 0.5
+
+
+def memory_usage_mb(df):
+    """Deep memory usage of a dataframe in MB"""
+    return df.memory_usage(deep=True).sum() / (1024 * 1024)
+
+
+def _downcast_float(series):
+    # Só reduz para float32 quando a conversão não perde precisão (ex.: valores monetários)
+    candidate = series.astype(np.float32)
+    same = (candidate.astype(np.float64) == series) | (series.isna() & candidate.isna())
+    return candidate if same.all() else series
+
+
+def compact_dataframe(df, category_ratio=DEFAULT_CATEGORY_RATIO, arrow_strings=False):
+    """Return a memory-compact copy of df.
+
+    Low-cardinality text columns become categoricals, integers and floats are
+    downcast to the smallest lossless dtype, and the remaining text columns
+    optionally use pyarrow-backed strings.
+    """
+    compact = df.copy()
+    for col in compact.columns:
+        series = compact[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            continue
+        if pd.api.types.is_integer_dtype(series):
+            compact[col] = pd.to_numeric(series, downcast='integer')
+        elif pd.api.types.is_float_dtype(series):
+            compact[col] = _downcast_float(series)
+        elif pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+            # Colunas objeto com números gigantes (ex.: chaves de NF-e) são mantidas como estão
+            if pd.api.types.infer_dtype(series, skipna=True) not in ('string', 'empty'):
+                continue
+            if len(series) and series.nunique(dropna=True) / len(series) < category_ratio:
+                compact[col] = series.astype('category')
+            elif arrow_strings:
+                compact[col] = series.astype('string[pyarrow]')
+    return compact
@@ -0,0 +1,114 @@
+import math
+import re
+import threading
+from collections import defaultdict
+
+import pandas as pd
+
+from utils.text_utils import normalize_text, fix_mojibake
+
+DEFAULT_TOP_K = 3
+DEFAULT_MIN_RELATIVE_SCORE = 0.5
+
+# Peso de cada origem do termo: nome do arquivo > nome de coluna > valor de categoria
+FILENAME_WEIGHT = 3.0
+COLUMN_WEIGHT = 2.0
+VALUE_WEIGHT = 1.0
+MAX_VALUE_CARDINALITY = 200
+MIN_TOKEN_LENGTH = 3
+# Valores categóricos curtos também contam (siglas de UF como SP, RJ)
+MIN_VALUE_TOKEN_LENGTH = 2
+
+STOPWORDS = {
+    'qual', 'quais', 'que', 'com', 'sem', 'para', 'por', 'dos', 'das', 'nos', 'nas', 'uma', 'sao', 'tem', 'ha',
+    'mais', 'menos', 'entre', 'sobre', 'como', 'quantos', 'quantas', 'the', 'and', 'for', 'with', 'what', 'which',
+    'how', 'many', 'much', 'are', 'from', 'dados', 'arquivo', 'arquivos', 'data', 'file', 'files', 'csv',
+    'de', 'do', 'da', 'em', 'no', 'na', 'os', 'as', 'um', 'ao', 'se', 'ou', 'me', 'eh', 'of', 'in', 'on', 'to',
+    'is', 'by', 'at', 'or', 'an',
+}
+
+
+def _tokens(text, min_length=MIN_TOKEN_LENGTH):
+    return {t for t in normalize_text(text).split() if len(t) >= min_length and t not in STOPWORDS}
+
+
+class FileIndex:
+    """Inverted index over filenames, column names and categorical values, used to rank files by relevance"""
+
+    def __init__(self):
+        self._postings = defaultdict(dict)  # termo -> {arquivo: peso}
+        self._files = set()
+        self._lock = threading.Lock()
+
+    def add(self, file, df):
+        """(Re)index a file; replaces any previous entries for it"""
+        terms = defaultdict(float)
+        for token in _tokens(re.sub(r'[_\-.]', ' ', file.rsplit('.', 1)[0])):
+            terms[token] = max(terms[token], FILENAME_WEIGHT)
+        for col in df.columns:
+            for token in _tokens(fix_mojibake(col)):
+                terms[token] = max(terms[token], COLUMN_WEIGHT)
+            series = df[col]
+            if pd.api.types.is_numeric_dtype(series):
+                continue
+            # Valores de colunas categóricas (baixa cardinalidade), a partir de uma amostra
+            values = series.dropna().head(10_000).unique()
+            if len(values) <= MAX_VALUE_CARDINALITY:
+                for value in values:
+                    for token in _tokens(fix_mojibake(value), MIN_VALUE_TOKEN_LENGTH):
+                        terms[token] = max(terms[token], VALUE_WEIGHT)
+        with self._lock:
+            self._remove(file)
+            for token, weight in terms.items():
+                self._postings[token][file] = weight
+            self._files.add(file)
+
+    def remove(self, file):
+        with self._lock:
+            self._remove(file)
+
+    def _remove(self, file):
+        for token in [t for t, files in self._postings.items() if file in files]:
+            del self._postings[token][file]
+            if not self._postings[token]:
+                del self._postings[token]
+        self._files.discard(file)
+
+    def rank(self, question):
+        """Return [(file, score)] sorted by relevance; terms present in fewer files weigh more (IDF)"""
+        scores, _ = self._score(question)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+    def _score(self, question):
+        """Scores per file, plus the files matched on a filename or column name"""
+        scores, structural = defaultdict(float), set()
+        with self._lock:
+            total = len(self._files)
+            # Tokens de 2 letras só existem no índice como valores categóricos
+            for token in _tokens(question, MIN_VALUE_TOKEN_LENGTH):
+                postings = self._postings.get(token, {})
+                if not postings:
+                    continue
+                idf = math.log(1 + total / len(postings))
+                for file, weight in postings.items():
+                    scores[file] += weight * idf
+                    if weight >= COLUMN_WEIGHT:
+                        structural.add(file)
+        return scores, structural
+
+    def select(self, question, files, top_k=DEFAULT_TOP_K, min_relative_score=DEFAULT_MIN_RELATIVE_SCORE):
+        """Pick the files worth querying, preserving the order of `files`.
+
+        Keeps at most top_k files scoring at least min_relative_score of the best
+        score. Files are only pruned when the best one matches the question on a
+        filename or column name: value hits alone (e.g. a word that happens to
+        appear in a product description) are too weak to exclude other files.
+        """
+        scores, structural = self._score(question)
+        ranking = sorted(((file, score) for file, score in scores.items() if file in files),
+                         key=lambda item: item[1], reverse=True)
+        if top_k <= 0 or not ranking or ranking[0][0] not in structural:
+            return list(files)
+        best = ranking[0][1]
+        chosen = {file for file, score in ranking[:top_k] if score >= best * min_relative_score}
+        return [file for file in files if file in chosen]
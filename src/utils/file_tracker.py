@@ -0,0 +1,55 @@
+import hashlib
+import os
+from collections import namedtuple
+
+# Estado de um arquivo no disco: tamanho, data de modificação e hash do conteúdo
+FileState = namedtuple('FileState', ['size', 'mtime', 'digest'])
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_digest(path):
+    """Return the SHA-1 of a file, read in fixed-size chunks"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FileTracker:
+    """Tracks (size, mtime, hash) of the files in a directory to detect new, changed and deleted files"""
+
+    def __init__(self):
+        self.states = {}
+
+    def scan(self, directory, extension, extra=None):
+        """Compare the directory against the known states.
+
+        Returns (changed, deleted): files that are new or whose content changed,
+        and files that are known but no longer exist. Files whose size/mtime
+        changed but whose hash did not are only re-stamped. extra maps names of
+        files that are not on disk (e.g. CSVs read from a .zip) to their FileState.
+        """
+        extra = extra or {}
+        present = [f for f in os.listdir(directory) if f.endswith(extension)]
+        deleted = [f for f in self.states if f not in present and f not in extra]
+        changed = [(file, state) for file, state in extra.items()
+                   if file not in present and getattr(self.states.get(file), 'digest', None) != state.digest]
+        for file in present:
+            stat = os.stat(os.path.join(directory, file))
+            known = self.states.get(file)
+            if known and known.size == stat.st_size and known.mtime == stat.st_mtime_ns:
+                continue
+            digest = file_digest(os.path.join(directory, file))
+            if known and known.digest == digest:
+                self.states[file] = FileState(stat.st_size, stat.st_mtime_ns, digest)
+                continue
+            changed.append((file, FileState(stat.st_size, stat.st_mtime_ns, digest)))
+        return changed, deleted
+
+    def mark_loaded(self, file, state):
+        self.states[file] = state
+
+    def forget(self, file):
+        self.states.pop(file, None)
@@ -1,10 +1,167 @@
+import json
 import os
+import shutil
+import threading
 import zipfile
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
-def unpack_archives(data_dir):
-    if not os.path.exists(data_dir):
-        os.makedirs(data_dir)
-    for file in os.listdir(data_dir):
-        if file.endswith('.zip'):
-            with zipfile.ZipFile(os.path.join(data_dir, file), 'r') as zip_ref:
-                zip_ref.extractall(data_dir)
+from utils.columnar_cache import CACHE_DIR_NAME
+
+DEFAULT_UNPACK_WORKERS = 4
+MANIFEST_NAME = 'unpack_manifest.json'
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# Membro CSV de um .zip lido direto do arquivo compactado, sem extração para o disco
+ArchiveMember = namedtuple('ArchiveMember', ['archive', 'name', 'crc', 'size', 'mtime'])
+
+
+def member_digest(member):
+    """Content fingerprint of an archive member, from the CRC and size in the zip directory"""
+    return f"zip:{member.crc:08x}:{member.size}"
+
+
+def open_member(member):
+    """Open an archive member for streaming reads; the caller closes the returned file"""
+    archive = zipfile.ZipFile(member.archive)
+    try:
+        stream = archive.open(member.name)
+    except Exception:
+        archive.close()
+        raise
+    # Fecha o zip junto com o membro
+    original_close = stream.close
+
+    def close():
+        original_close()
+        archive.close()
+
+    stream.close = close
+    return stream
+
+
+class ArchiveUnpacker:
+    """Incremental extraction of the .zip files in a directory.
+
+    A manifest in .cache/ records the CRC and size of every extracted member, so
+    unchanged members are skipped. Members are streamed to disk in fixed-size
+    blocks, and several archives are extracted concurrently. With
+    csv_to_disk=False, top-level CSV members up to max_virtual_mb are not written
+    to disk and are returned as ArchiveMember entries for the loader to read
+    directly. CSVs in subfolders of the archive are extracted in both modes; the
+    loader only reads top-level CSVs, so both modes load the same datasets.
+    """
+
+    def __init__(self, data_dir, max_workers=DEFAULT_UNPACK_WORKERS, csv_to_disk=True, max_virtual_mb=None):
+        self.data_dir = data_dir
+        self.max_workers = max(1, max_workers)
+        self.csv_to_disk = csv_to_disk
+        self.max_virtual_mb = max_virtual_mb
+        self.manifest_path = os.path.join(data_dir, CACHE_DIR_NAME, MANIFEST_NAME)
+        self._manifest = self._read_manifest()
+        self._lock = threading.Lock()
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_manifest(self):
+        try:
+            os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+            with open(self.manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(self._manifest, f)
+            os.replace(self.manifest_path + '.tmp', self.manifest_path)
+        except OSError as e:
+            print(f"Não foi possível gravar o manifesto de extração: {e}")
+
+    def sync(self):
+        """Extract new/changed members of every archive; returns (extracted, virtual_csvs)"""
+        os.makedirs(self.data_dir, exist_ok=True)
+        archives = sorted(f for f in os.listdir(self.data_dir) if f.lower().endswith('.zip'))
+        with self._lock:
+            for gone in [a for a in self._manifest if a not in archives]:
+                del self._manifest[gone]
+        extracted, virtual = [], {}
+        if archives:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(archives)),
+                                    thread_name_prefix="unpack") as pool:
+                for done, members in pool.map(self._unpack_one, archives):
+                    extracted.extend(done)
+                    for member in members:
+                        # Um CSV já presente no disco tem prioridade sobre o membro compactado
+                        if not os.path.exists(os.path.join(self.data_dir, member.name)):
+                            virtual.setdefault(member.name, member)
+        with self._lock:
+            self._write_manifest()
+        if extracted:
+            print(f"Arquivos extraídos: {len(extracted)} membro(s) novo(s) ou alterado(s)")
+        return extracted, virtual
+
+    def _unpack_one(self, archive_name):
+        path = os.path.join(self.data_dir, archive_name)
+        extracted, virtual = [], []
+        try:
+            archive_mtime = os.stat(path).st_mtime_ns
+            with zipfile.ZipFile(path) as archive:
+                with self._lock:
+                    known = dict(self._manifest.get(archive_name, {}))
+                current = {}
+                for info in archive.infolist():
+                    if info.is_dir():
+                        continue
+                    target = self._target_path(info.filename)
+                    if target is None:
+                        print(f"Membro ignorado (caminho fora do diretório de dados): {archive_name}/{info.filename}")
+                        continue
+                    if self._keep_in_archive(info):
+                        virtual.append(ArchiveMember(path, info.filename, info.CRC, info.file_size, archive_mtime))
+                        continue
+                    entry = [info.CRC, info.file_size]
+                    current[info.filename] = entry
+                    if known.get(info.filename) == entry and os.path.exists(target) \
+                            and os.path.getsize(target) == info.file_size:
+                        continue
+                    self._extract_member(archive, info, target)
+                    extracted.append(info.filename)
+            with self._lock:
+                self._manifest[archive_name] = current
+        except (zipfile.BadZipFile, OSError) as e:
+            print(f"Erro ao extrair {archive_name}: {e}")
+        return extracted, virtual
+
+    def _keep_in_archive(self, info):
+        if self.csv_to_disk or not info.filename.lower().endswith('.csv'):
+            return False
+        # Como no modo disco, CSVs em subpastas são extraídos e não entram na carga
+        if '/' in info.filename:
+            return False
+        # Arquivos grandes são lidos em blocos pelo caminho do disco
+        return self.max_virtual_mb is None or info.file_size <= self.max_virtual_mb * 1024 * 1024
+
+    def _target_path(self, member_name):
+        """Destination of a member inside data_dir, or None for unsafe paths (zip slip)"""
+        root = os.path.realpath(self.data_dir)
+        target = os.path.realpath(os.path.join(root, member_name))
+        return target if target.startswith(root + os.sep) else None
+
+    @staticmethod
+    def _extract_member(archive, info, target):
+        # Cópia em blocos para um arquivo temporário: o leitor nunca vê um CSV pela metade
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        partial = f"{target}.part-{threading.get_ident()}"
+        try:
+            with archive.open(info) as source, open(partial, 'wb') as dest:
+                shutil.copyfileobj(source, dest, COPY_BUFFER_SIZE)
+            os.replace(partial, target)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+
+
+def unpack_archives(data_dir, max_workers=DEFAULT_UNPACK_WORKERS):
+    """Incrementally extract every .zip in data_dir; returns the extracted member names"""
+    extracted, _ = ArchiveUnpacker(data_dir, max_workers=max_workers).sync()
+    return extracted
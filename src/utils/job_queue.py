@@ -0,0 +1,209 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_JOB_WORKERS = 2
+DEFAULT_JOB_QUEUE_SIZE = 20
+DEFAULT_FINISHED_JOBS_KEPT = 200
+# Intervalo de leitura do estado de um job executado por outro processo
+STATE_POLL_SECONDS = 0.5
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue has no room for another job"""
+
+
+class Job:
+    """A background query: status, final result and the stream of partial events.
+
+    With a state_dir, the job also writes its status to <id>.json and appends its
+    events to <id>.events.jsonl, so other processes can follow it (see Job.load).
+    """
+
+    def __init__(self, question, model, state_dir=None):
+        self.id = uuid.uuid4().hex
+        self.question = question
+        self.model = model
+        self.status = 'pendente'
+        self.result = None
+        self.error = None
+        self.events = []
+        self.created_at = time.time()
+        self.finished_at = None
+        self.state_dir = state_dir
+        self._remote = False
+        self._changed = threading.Condition()
+
+    @classmethod
+    def load(cls, state_dir, job_id):
+        """Read-only view of a job run by another process, or None if there is no state for it"""
+        job = cls(None, None, state_dir)
+        job.id = job_id
+        job._remote = True
+        return job if job._reload() else None
+
+    @property
+    def done(self):
+        return self.status in ('concluido', 'erro')
+
+    def publish(self, event, data):
+        """Append an event (e.g. a per-file partial result) and wake up listeners"""
+        with self._changed:
+            self._append_event({'event': event, 'data': data})
+            self._changed.notify_all()
+
+    def wait_for_events(self, seen, timeout):
+        """Block until there are more than `seen` events or the job finishes; returns the new events"""
+        if self._remote:
+            deadline = time.monotonic() + timeout
+            while len(self.events) <= seen and not self.done and time.monotonic() < deadline:
+                time.sleep(STATE_POLL_SECONDS)
+                self._reload()
+            return self.events[seen:]
+        with self._changed:
+            self._changed.wait_for(lambda: len(self.events) > seen or self.done, timeout=timeout)
+            return self.events[seen:]
+
+    def _set_status(self, status):
+        with self._changed:
+            self.status = status
+            self._save_state()
+            self._append_event({'event': 'status', 'data': status})
+            self._changed.notify_all()
+
+    def _finish(self, status, result=None, error=None):
+        with self._changed:
+            self.status = status
+            self.result = result
+            self.error = error
+            self.finished_at = time.time()
+            # Evento antes do estado: quem lê o estado "concluido" já encontra o evento final
+            self._append_event({'event': status, 'data': result if error is None else error})
+            self._save_state()
+            self._changed.notify_all()
+
+    def _state_path(self, suffix):
+        return os.path.join(self.state_dir, f"{self.id}{suffix}")
+
+    def _append_event(self, event):
+        self.events.append(event)
+        if self.state_dir is None:
+            return
+        try:
+            with open(self._state_path('.events.jsonl'), 'a', encoding='utf-8') as f:
+                f.write(json.dumps(event, ensure_ascii=False, default=str) + "\n")
+        except OSError as e:
+            print(f"Não foi possível gravar o evento do job {self.id}: {e}")
+
+    def _save_state(self):
+        if self.state_dir is None:
+            return
+        state = dict(self.to_dict(), result=self.result, error=self.error)
+        path = self._state_path('.json')
+        try:
+            os.makedirs(self.state_dir, exist_ok=True)
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False, default=str)
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            print(f"Não foi possível gravar o estado do job {self.id}: {e}")
+
+    def _reload(self):
+        try:
+            with open(self._state_path('.json'), encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return False
+        self.question, self.model, self.status = state['question'], state['model'], state['status']
+        self.result, self.error = state.get('result'), state.get('error')
+        self.created_at, self.finished_at = state['created_at'], state['finished_at']
+        events = []
+        try:
+            with open(self._state_path('.events.jsonl'), encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        events.append(json.loads(line))
+                    except ValueError:
+                        break  # Linha ainda sendo gravada
+        except OSError:
+            pass
+        self.events = events
+        return True
+
+    def _remove_state(self):
+        if self.state_dir is None:
+            return
+        for suffix in ('.json', '.events.jsonl'):
+            try:
+                os.remove(self._state_path(suffix))
+            except OSError:
+                pass
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'question': self.question,
+            'model': self.model,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+            'elapsed': round((self.finished_at or time.time()) - self.created_at, 2),
+            'partial_results': len([e for e in self.events if e['event'] == 'parcial']),
+        }
+
+
+class JobQueue:
+    """Bounded background worker pool for long-running queries, with backpressure.
+
+    Jobs run in the process that accepted them. With a state_dir shared by all
+    processes (e.g. gunicorn workers), get() also finds jobs run by another
+    process, as read-only views of their saved state.
+    """
+
+    def __init__(self, max_workers=DEFAULT_JOB_WORKERS, max_pending=DEFAULT_JOB_QUEUE_SIZE,
+                 max_finished=DEFAULT_FINISHED_JOBS_KEPT, state_dir=None):
+        self.max_finished = max_finished
+        self.state_dir = state_dir
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='query-job')
+        # Vagas = workers + fila de espera; sem vaga, a submissão é recusada
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, question, model, fn):
+        """Queue fn(job) to run in the background; raises QueueFullError when there is no room"""
+        if not self._slots.acquire(blocking=False):
+            raise QueueFullError("Fila de consultas cheia. Tente novamente em instantes.")
+        job = Job(question, model, self.state_dir)
+        job._save_state()
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job, fn)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and self.state_dir is not None and all(c in '0123456789abcdef' for c in job_id):
+            job = Job.load(self.state_dir, job_id)
+        return job
+
+    def _run(self, job, fn):
+        try:
+            job._set_status('executando')
+            job._finish('concluido', result=fn(job))
+        except Exception as e:
+            job._finish('erro', error=str(e))
+        finally:
+            self._slots.release()
+
+    def _prune(self):
+        # Descarta os jobs finalizados mais antigos além do limite
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            self._jobs.pop(job_id)._remove_state()
@@ -0,0 +1,165 @@
+import contextvars
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Limites (segundos) dos buckets dos histogramas de latência
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+METRIC_PREFIX = 'csv_agent_'
+
+# Trace da requisição atual (propagado às threads via contextvars.copy_context)
+_current_trace = contextvars.ContextVar('csv_agent_trace', default=None)
+
+
+def _label_key(labels):
+    return tuple(sorted((str(k), str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class MetricsRegistry:
+    """In-process counters, gauges and latency histograms rendered in the Prometheus text format"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counters = defaultdict(lambda: defaultdict(float))
+        self._gauges = defaultdict(dict)
+        # nome -> labels -> [contagens por bucket..., soma, total]
+        self._histograms = defaultdict(dict)
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            self._counters[name][_label_key(labels)] += value
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[name][_label_key(labels)] = value
+
+    def observe(self, name, seconds, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms[name].get(key)
+            if series is None:
+                series = self._histograms[name][key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[i] += 1
+            series[-2] += seconds
+            series[-1] += 1
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        with self._lock:
+            for kind, metrics in (('counter', self._counters), ('gauge', self._gauges)):
+                for name in sorted(metrics):
+                    full = METRIC_PREFIX + name
+                    if name in self._help:
+                        lines.append(f"# HELP {full} {self._help[name]}")
+                    lines.append(f"# TYPE {full} {kind}")
+                    for key, value in sorted(metrics[name].items()):
+                        lines.append(f"{full}{_format_labels(key)} {value:g}")
+            for name in sorted(self._histograms):
+                full = METRIC_PREFIX + name
+                if name in self._help:
+                    lines.append(f"# HELP {full} {self._help[name]}")
+                lines.append(f"# TYPE {full} histogram")
+                for key, series in sorted(self._histograms[name].items()):
+                    for bound, count in zip(self.buckets, series):
+                        lines.append(f"{full}_bucket{_format_labels(key, [('le', f'{bound:g}')])} {count}")
+                    lines.append(f"{full}_bucket{_format_labels(key, [('le', '+Inf')])} {series[-1]}")
+                    lines.append(f"{full}_sum{_format_labels(key)} {series[-2]:.6f}")
+                    lines.append(f"{full}_count{_format_labels(key)} {series[-1]}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+
+class Trace:
+    """Spans recorded during one request, used for the per-request timing breakdown"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = []  # (nome, detalhe, segundos, ok)
+        self._lock = threading.Lock()
+
+    def add(self, name, detail, seconds, ok):
+        with self._lock:
+            self.spans.append((name, detail, seconds, ok))
+
+    def breakdown(self):
+        """Total time, and count/total seconds per span name (nested spans overlap their parents)"""
+        totals = {}
+        with self._lock:
+            for name, _, seconds, _ in self.spans:
+                entry = totals.setdefault(name, {'count': 0, 'seconds': 0.0})
+                entry['count'] += 1
+                entry['seconds'] += seconds
+        return {'total_seconds': time.perf_counter() - self.started, 'spans': totals}
+
+    def format(self):
+        """Human-readable breakdown appended to responses"""
+        breakdown = self.breakdown()
+        lines = [f"Tempos da requisição (total {breakdown['total_seconds']:.3f}s):"]
+        for name, entry in sorted(breakdown['spans'].items(), key=lambda item: -item[1]['seconds']):
+            lines.append(f"- {name}: {entry['seconds']:.3f}s ({entry['count']}x)")
+        return "\n".join(lines)
+
+
+metrics = MetricsRegistry()
+metrics.describe('span_seconds', 'Duração das etapas do pipeline (carga, agentes, chamadas ao LLM)')
+metrics.describe('span_errors_total', 'Etapas do pipeline encerradas com exceção')
+
+
+@contextmanager
+def span(name, detail=None, **labels):
+    """Time a block: observe span_seconds{span=name, ...} and record it in the current trace.
+
+    labels become metric labels (keep them low-cardinality, e.g. the model);
+    detail (e.g. the file name) only goes to the per-request trace.
+    """
+    start = time.perf_counter()
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        seconds = time.perf_counter() - start
+        metrics.observe('span_seconds', seconds, span=name, **labels)
+        if not ok:
+            metrics.inc('span_errors_total', span=name, **labels)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(name, detail, seconds, ok)
+
+
+@contextmanager
+def trace_request():
+    """Collect the spans of the enclosed block (and of worker threads started from it) in a Trace"""
+    trace = Trace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def submit_in_context(executor, fn, *args, **kwargs):
+    """executor.submit that carries the current trace into the worker thread"""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
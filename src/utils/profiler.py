@@ -0,0 +1,62 @@
+import pandas as pd
+
+DEFAULT_TOP_VALUES = 5
+DEFAULT_SAMPLE_ROWS = 3
+MAX_VALUE_CHARS = 40
+
+
+def _short(value):
+    text = str(value)
+    return text if len(text) <= MAX_VALUE_CHARS else text[:MAX_VALUE_CHARS - 3] + '...'
+
+
+def build_profile(df, top_values=DEFAULT_TOP_VALUES, sample_rows=DEFAULT_SAMPLE_ROWS):
+    """Compute a per-column profile of df: dtype, nulls, cardinality, min/max, top values and sample rows"""
+    columns = []
+    for col in df.columns:
+        series = df[col]
+        info = {
+            'name': str(col),
+            'dtype': str(series.dtype),
+            'nulls': int(series.isna().sum()),
+            'unique': int(series.nunique(dropna=True)),
+        }
+        is_numeric = pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+        if is_numeric and series.count():
+            info['min'] = series.min()
+            info['max'] = series.max()
+        elif series.count() and info['unique'] <= max(top_values * 4, len(series) // 2):
+            # Valores mais frequentes apenas para colunas de baixa cardinalidade
+            counts = series.value_counts(dropna=True).head(top_values)
+            info['top'] = [(_short(value), int(count)) for value, count in counts.items()]
+        columns.append(info)
+    return {
+        'rows': len(df),
+        'columns': columns,
+        'sample': df.head(sample_rows).copy(),
+    }
+
+
+def describe_profile(profile, max_columns=None, include_sample=True):
+    """Render a profile as compact text for the agent prompt.
+
+    max_columns limits the detailed columns (the remaining ones are listed by
+    name only); include_sample=False drops the sample rows.
+    """
+    shown = profile['columns'] if max_columns is None else profile['columns'][:max_columns]
+    lines = [f"Linhas: {profile['rows']} | Colunas: {len(profile['columns'])}"]
+    for info in shown:
+        line = f"- {info['name']} [{info['dtype']}]: {info['nulls']} nulos, {info['unique']} distintos"
+        if 'min' in info:
+            line += f", min={info['min']}, max={info['max']}"
+        if info.get('top'):
+            line += ", mais frequentes: " + "; ".join(f"{value} ({count})" for value, count in info['top'])
+        lines.append(line)
+    if len(shown) < len(profile['columns']):
+        rest = [info['name'] for info in profile['columns'][len(shown):]]
+        lines.append(f"... e mais {len(rest)} colunas: " + ", ".join(rest))
+    if include_sample:
+        sample = profile['sample']
+        lines.append("Linhas de exemplo:")
+        lines.append(sample[sample.columns[:len(shown)]].to_string(max_colwidth=MAX_VALUE_CHARS))
+    return "\n".join(lines)
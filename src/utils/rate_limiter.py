@@ -0,0 +1,26 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """Token bucket shared by threads: at most `per_minute` acquisitions per minute, with small bursts"""
+
+    def __init__(self, per_minute, burst=None):
+        self.interval = 60.0 / per_minute
+        self.capacity = burst or max(1, int(per_minute // 10))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a slot is available"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) / self.interval)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) * self.interval
+            time.sleep(wait)
@@ -0,0 +1,73 @@
+import hashlib
+import json
+import os
+from contextlib import contextmanager
+
+from utils.columnar_cache import CACHE_DIR_NAME
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos (um único worker)
+    fcntl = None
+
+STATE_FILE = 'shared_store.json'
+LOCK_FILE = 'shared_store.lock'
+
+
+def datasets_signature(fingerprints):
+    """Signature of the loaded datasets (file names and content hashes)"""
+    payload = json.dumps(sorted(fingerprints.items()))
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+class SharedStore:
+    """Version counter and inter-process lock for the datasets shared by several workers.
+
+    The data itself lives in the columnar cache (uncompressed Arrow IPC files
+    mapped by every worker). The worker that changes the datasets (upload,
+    new zip) bumps the version; the others notice it on their next query and
+    reload, mapping the files another worker already wrote instead of parsing.
+    """
+
+    def __init__(self, data_dir):
+        self.cache_dir = os.path.join(data_dir, CACHE_DIR_NAME)
+        self.state_path = os.path.join(self.cache_dir, STATE_FILE)
+        self.lock_path = os.path.join(self.cache_dir, LOCK_FILE)
+
+    def _read_state(self):
+        try:
+            with open(self.state_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'version': 0, 'signature': None}
+
+    def version(self):
+        return self._read_state().get('version', 0)
+
+    @contextmanager
+    def lock(self):
+        """Exclusive lock across worker processes: only one of them extracts/parses at a time"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(self.lock_path, 'a') as handle:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def publish(self, fingerprints):
+        """Record the current datasets; bumps the version only if they differ from the published ones.
+
+        Call while holding lock(). Returns the current version.
+        """
+        state = self._read_state()
+        signature = datasets_signature(fingerprints)
+        if state.get('signature') == signature:
+            return state.get('version', 0)
+        state = {'version': state.get('version', 0) + 1, 'signature': signature}
+        with open(self.state_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(self.state_path + '.tmp', self.state_path)
+        return state['version']
@@ -0,0 +1,19 @@
+import re
+import unicodedata
+
+
+def normalize_text(text):
+    """Lowercase, strip accents and punctuation, collapse whitespace"""
+    text = unicodedata.normalize('NFKD', str(text).lower())
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    text = re.sub(r'[^\w\s]', ' ', text)
+    return ' '.join(text.split())
+
+
+def fix_mojibake(value):
+    """Repair UTF-8 text that was decoded as latin1 (e.g. 'RAZÃ\\x83O' -> 'RAZÃO')"""
+    # Os CSVs são lidos em latin1, então nomes e valores UTF-8 chegam "quebrados"
+    try:
+        return str(value).encode('latin1').decode('utf-8')
+    except (UnicodeEncodeError, UnicodeDecodeError):
+        return str(value)
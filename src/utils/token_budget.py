@@ -0,0 +1,88 @@
+import os
+
+from langchain_core.tools import Tool
+
+# Janela de contexto (tokens) dos modelos gratuitos do OpenRouter
+MODEL_CONTEXT_WINDOWS = {
+    "deepseek/deepseek-prover-v2:free": 163_840,
+    "google/gemma-2-9b-it:free": 8_192,
+    "meta-llama/llama-3.2-3b-instruct:free": 20_000,
+    "microsoft/phi-3-mini-128k-instruct:free": 128_000,
+    "mistralai/mistral-7b-instruct:free": 32_768,
+    "qwen/qwen-2-7b-instruct:free": 32_768,
+    "nousresearch/nous-capybara-7b:free": 4_096,
+    "openchat/openchat-7b:free": 8_192,
+    "huggingfaceh4/zephyr-7b-beta:free": 4_096,
+}
+DEFAULT_CONTEXT_WINDOW = 8_192
+
+# Estimativa conservadora para português com tokenizers de modelos abertos (sem baixar vocabulários)
+CHARS_PER_TOKEN = 3.5
+# Fração da janela para o prompt inicial do agente; o restante fica para o raciocínio e as observações
+PROMPT_SHARE = 0.4
+# Fração da janela para a saída de cada chamada de ferramenta
+TOOL_OUTPUT_SHARE = 0.1
+MAX_TOOL_OUTPUT_CHARS = 8_000
+
+
+def estimate_tokens(text):
+    """Rough token count of text (about CHARS_PER_TOKEN characters per token)"""
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+
+def context_window(model):
+    """Context window of a model; unknown models use CSV_AGENT_CONTEXT_WINDOW (default 8192)"""
+    if model in MODEL_CONTEXT_WINDOWS:
+        return MODEL_CONTEXT_WINDOWS[model]
+    return int(os.environ.get('CSV_AGENT_CONTEXT_WINDOW', DEFAULT_CONTEXT_WINDOW))
+
+
+def cap_output(text, max_chars):
+    """Truncate a tool output, keeping the beginning and the end"""
+    text = str(text)
+    if max_chars <= 0 or len(text) <= max_chars:
+        return text
+    head = max_chars * 2 // 3
+    tail = max_chars - head
+    omitted = len(text) - head - tail
+    return f"{text[:head]}\n... [saída truncada: {omitted} caracteres omitidos] ...\n{text[-tail:]}"
+
+
+class TokenBudget:
+    """Prompt and tool-output budget of one model"""
+
+    def __init__(self, model, window=None):
+        self.model = model
+        self.window = window or context_window(model)
+        self.prompt_tokens = int(self.window * PROMPT_SHARE)
+        self.tool_output_chars = min(MAX_TOOL_OUTPUT_CHARS,
+                                     int(self.window * TOOL_OUTPUT_SHARE * CHARS_PER_TOKEN))
+
+    def fits(self, text):
+        return estimate_tokens(text) <= self.prompt_tokens
+
+    def choose(self, candidates):
+        """First (label, text) candidate that fits the prompt budget, or the last (smallest) one"""
+        chosen = None
+        for chosen in candidates:
+            if self.fits(chosen[1]):
+                break
+        return chosen
+
+    def cap_tools(self, tools):
+        """Wrap tools so that each observation fits the tool-output budget"""
+        return [self._capped(tool) for tool in tools]
+
+    def _capped(self, tool):
+        return Tool(name=tool.name, description=tool.description, func=CappedRun(tool, self.tool_output_chars))
+
+
+class CappedRun:
+    """Callable behind a capped tool: runs the wrapped tool and truncates its output"""
+
+    def __init__(self, tool, limit):
+        self.tool = tool
+        self.limit = limit
+
+    def __call__(self, tool_input):
+        return cap_output(self.tool.run(tool_input), self.limit)
@@ -1,23 +1,32 @@
-from flask import Flask, request, render_template, redirect, url_for
+from flask import Flask, request, render_template, redirect, url_for, jsonify, Response, stream_with_context, g, send_file
 import os
 from agents.csv_agent import CsvAgent
 import sys
-from pyunpack import Archive
-from utils.file_unpacker import unpack_archives
+from utils.job_queue import JobQueue, QueueFullError, DEFAULT_JOB_WORKERS, DEFAULT_JOB_QUEUE_SIZE
+from utils.metrics import metrics, trace_request
+from utils.columnar_cache import CACHE_DIR_NAME
+from agents.batch_runner import BatchRunner, DEFAULT_BATCH_CONCURRENCY, MAX_BATCH_QUESTIONS
 import time
 from dotenv import load_dotenv
 import html
+import json
 
 # Load environment variables from .env file
 load_dotenv(os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env'))
 
-UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'data')
+UPLOAD_FOLDER = os.environ.get('CSV_AGENT_DATA_DIR') or os.path.join(os.path.dirname(__file__), 'data')
 ALLOWED_EXTENSIONS = {'csv', 'zip'}
 TEMPLATE_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'templates')
 
 app = Flask(__name__, template_folder=TEMPLATE_FOLDER)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-csv_agent = CsvAgent()
+csv_agent = CsvAgent(data_dir=UPLOAD_FOLDER)
+# Fila de consultas em segundo plano (workers limitados e fila com tamanho máximo)
+job_queue = JobQueue(
+    max_workers=int(os.environ.get('CSV_AGENT_JOB_WORKERS', DEFAULT_JOB_WORKERS)),
+    max_pending=int(os.environ.get('CSV_AGENT_JOB_QUEUE_SIZE', DEFAULT_JOB_QUEUE_SIZE)),
+    # Estado dos jobs no diretório de dados: qualquer worker do gunicorn responde ao polling
+    state_dir=os.path.join(csv_agent.data_dir, CACHE_DIR_NAME, 'jobs'))
 
 # List of free models available on OpenRouter (ordered by reliability)
 FREE_MODELS = [
@@ -32,6 +41,30 @@ FREE_MODELS = [
     "huggingfaceh4/zephyr-7b-beta:free"
 ]
 
+def timings_requested():
+    """Per-request timing breakdown: form/query field timings=1 or CSV_AGENT_TIMINGS=1"""
+    value = request.values.get('timings') or (request.get_json(silent=True) or {}).get('timings')
+    if value is None:
+        return os.environ.get('CSV_AGENT_TIMINGS', '0') == '1'
+    return str(value).lower() in ('1', 'true', 'on', 'sim')
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    if request.endpoint != 'metrics_endpoint' and 'request_start' in g:
+        route = request.url_rule.rule if request.url_rule else 'desconhecida'
+        metrics.observe('http_request_seconds', time.perf_counter() - g.request_start,
+                        route=route, method=request.method, status=response.status_code)
+    return response
+
+def loaded_files():
+    """CSVs the agent can query: files on disk and CSVs read straight from a .zip"""
+    csv_agent.refresh_if_stale()
+    return sorted(csv_agent.dataframes)
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -41,9 +74,8 @@ def index():
     print(f"📁 TEMPLATE_FOLDER: {TEMPLATE_FOLDER}")
     print(f"📁 UPLOAD_FOLDER: {UPLOAD_FOLDER}")
     
-    files = os.listdir(UPLOAD_FOLDER)
-    csv_files = [f for f in files if f.endswith('.csv')]
-    print(f"📄 Arquivos CSV encontrados: {csv_files}")
+    csv_files = loaded_files()
+    print(f"📄 Arquivos CSV carregados: {csv_files}")
     print(f"🔧 Modelos disponíveis: {len(FREE_MODELS)}")
     
     return render_template('main.html', response=None, files=csv_files, models=FREE_MODELS)
@@ -62,26 +94,33 @@ def upload_file():
     if file and allowed_file(file.filename):
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
         file.save(filepath)
-        if file.filename.endswith('.zip'):
-            unpack_archives(app.config['UPLOAD_FOLDER'])
-        csv_agent._load_csvs()  # Reload CSVs
+        if file.filename.lower().endswith('.zip'):
+            # Extração e carga em segundo plano: exportações grandes não travam o servidor
+            try:
+                job = job_queue.submit(f"Descompactar {file.filename}", None, lambda job: csv_agent.reload_data())
+                print(f"📦 Extração de {file.filename} enfileirada: job {job.id}")
+                return redirect(url_for('index'))
+            except QueueFullError as e:
+                print(f"🚫 {e}; extraindo {file.filename} imediatamente")
+        csv_agent.reload_data()  # Reload CSVs (invalida apenas os agentes dos arquivos alterados)
     return redirect(url_for('index'))
 
 @app.route('/query', methods=['POST'])
 def query():
     selected_model = request.form.get('model')
     question = request.form.get('question')
+    mode = request.form.get('mode')
     
     print(f"🔍 Nova consulta recebida:")
     print(f"   Modelo: {selected_model}")
+    print(f"   Modo: {mode or csv_agent.query_mode}")
     print(f"   Pergunta: {question}")
     
     if not selected_model or not question:
         print("❌ Erro: Modelo ou pergunta não fornecidos")
         return "Erro: Modelo e pergunta são obrigatórios.", 400
     
-    files = os.listdir(UPLOAD_FOLDER)
-    csv_files = [f for f in files if f.endswith('.csv')]
+    csv_files = loaded_files()
     
     if not csv_files:
         error_message = "Não há arquivos CSV disponíveis para consulta. Por favor, faça o upload de pelo menos um arquivo CSV."
@@ -91,8 +130,11 @@ def query():
     try:
         print("🤖 Iniciando processamento da consulta...")
         start_time = time.time()
-        response = csv_agent.process_query(question, selected_model)
+        with trace_request() as trace:
+            response = csv_agent.process_query(question, selected_model, mode=mode)
         query_time = round(time.time() - start_time, 2)
+        if timings_requested():
+            response = f"{response}\n\n{trace.format()}"
         
         print(f"✅ Consulta processada em {query_time}s")
         print(f"📄 Resposta recebida (primeiros 200 chars): {str(response)[:200]}...")
@@ -144,6 +186,149 @@ def query():
     
     return render_template('main.html', response=formatted_response, files=csv_files, models=FREE_MODELS)
 
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    selected_model = request.form.get('model') or (request.get_json(silent=True) or {}).get('model')
+    question = request.form.get('question') or (request.get_json(silent=True) or {}).get('question')
+    mode = request.form.get('mode') or (request.get_json(silent=True) or {}).get('mode')
+    if not selected_model or not question:
+        return jsonify({'error': 'Modelo e pergunta são obrigatórios.'}), 400
+
+    with_timings = timings_requested()
+
+    def run(job):
+        # Cada arquivo concluído vira um evento "parcial" para o stream SSE
+        with trace_request() as trace:
+            result = csv_agent.process_query(
+                question, selected_model, mode=mode,
+                on_partial=lambda file, text, success: job.publish('parcial', {'file': file, 'success': success, 'text': text}))
+        if with_timings:
+            job.publish('tempos', trace.breakdown())
+            result = f"{result}\n\n{trace.format()}"
+        return result
+
+    try:
+        job = job_queue.submit(question, selected_model, run)
+    except QueueFullError as e:
+        print(f"🚫 {e}")
+        response = jsonify({'error': str(e)})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+
+    print(f"📥 Consulta enfileirada: job {job.id}")
+    return jsonify({
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': url_for('job_status', job_id=job.id),
+        'result_url': url_for('job_result', job_id=job.id),
+        'events_url': url_for('job_events', job_id=job.id),
+    }), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job não encontrado.'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job não encontrado.'}), 404
+    if not job.done:
+        return jsonify(job.to_dict()), 202
+    return jsonify(dict(job.to_dict(), result=job.result, error=job.error))
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job não encontrado.'}), 404
+
+    def stream():
+        seen = 0
+        while True:
+            events = job.wait_for_events(seen, timeout=15)
+            if not events:
+                # Comentário SSE para manter a conexão aberta
+                yield ": keep-alive\n\n"
+            for event in events:
+                yield f"event: {event['event']}\ndata: {json.dumps(event['data'], ensure_ascii=False)}\n\n"
+            seen += len(events)
+            if job.done and seen >= len(job.events):
+                break
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def batch_output_path(job_id):
+    return os.path.join(csv_agent.data_dir, CACHE_DIR_NAME, 'batches', f"{job_id}.jsonl")
+
+@app.route('/batch', methods=['POST'])
+def submit_batch():
+    payload = request.get_json(silent=True) or {}
+    questions = payload.get('questions') or request.form.get('questions', '')
+    # Texto (formulário ou JSON) tem uma pergunta por linha; qualquer outro tipo que não seja lista é recusado
+    if isinstance(questions, str):
+        questions = questions.splitlines()
+    if not isinstance(questions, list):
+        return jsonify({'error': 'O campo "questions" deve ser uma lista de perguntas.'}), 400
+    questions = [str(q).strip() for q in questions if str(q).strip()]
+    if not questions:
+        return jsonify({'error': 'Informe a lista de perguntas (campo "questions").'}), 400
+    if len(questions) > MAX_BATCH_QUESTIONS:
+        return jsonify({'error': f'Máximo de {MAX_BATCH_QUESTIONS} perguntas por lote.'}), 400
+    selected_model = payload.get('model') or request.form.get('model')
+    mode = payload.get('mode') or request.form.get('mode')
+    concurrency = int(os.environ.get('CSV_AGENT_BATCH_CONCURRENCY', DEFAULT_BATCH_CONCURRENCY))
+
+    def run(job):
+        # Cada resposta é gravada no JSONL e publicada como evento "parcial" no stream SSE
+        runner = BatchRunner(csv_agent, model=selected_model, mode=mode, concurrency=concurrency)
+        return runner.run(questions, batch_output_path(job.id),
+                          on_result=lambda record: job.publish('parcial', record))
+
+    try:
+        job = job_queue.submit(f"Lote com {len(questions)} perguntas", selected_model, run)
+    except QueueFullError as e:
+        print(f"🚫 {e}")
+        response = jsonify({'error': str(e)})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+
+    print(f"📥 Lote enfileirado: job {job.id} ({len(questions)} perguntas)")
+    return jsonify({
+        'job_id': job.id,
+        'status': job.status,
+        'questions': len(questions),
+        'status_url': url_for('job_status', job_id=job.id),
+        'events_url': url_for('job_events', job_id=job.id),
+        'results_url': url_for('batch_results', job_id=job.id),
+    }), 202
+
+@app.route('/batch/<job_id>', methods=['GET'])
+def batch_results(job_id):
+    # JSONL com as respostas já concluídas (parcial enquanto o lote estiver em execução)
+    path = batch_output_path(job_id)
+    if job_queue.get(job_id) is None and not os.path.exists(path):
+        return jsonify({'error': 'Lote não encontrado.'}), 404
+    if not os.path.exists(path):
+        return Response('', mimetype='application/x-ndjson')
+    return send_file(path, mimetype='application/x-ndjson', max_age=0)
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    # Estado atual dos modelos (circuit breaker e latências) como gauges
+    for model, stats in csv_agent.model_health.snapshot().items():
+        metrics.set_gauge('model_circuit_open', int(stats['circuit_open']), model=model)
+        if stats['p50'] is not None:
+            metrics.set_gauge('model_latency_p50_seconds', stats['p50'], model=model)
+            metrics.set_gauge('model_latency_p95_seconds', stats['p95'], model=model)
+    metrics.set_gauge('dataframes_loaded', len(csv_agent.dataframes))
+    metrics.set_gauge('agents_cached', len(csv_agent.agent_cache))
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
     if not os.path.exists(UPLOAD_FOLDER):
         os.makedirs(UPLOAD_FOLDER)
@@ -153,12 +338,10 @@ if __name__ == '__main__':
 # Error handlers
 @app.errorhandler(404)
 def page_not_found(e):
-    files = os.listdir(UPLOAD_FOLDER)
-    csv_files = [f for f in files if f.endswith('.csv')]
+    csv_files = sorted(csv_agent.dataframes)
     return render_template('main.html', response="Erro 404: Página não encontrada", files=csv_files, models=FREE_MODELS), 404
 
 @app.errorhandler(500)
 def internal_server_error(e):
-    files = os.listdir(UPLOAD_FOLDER)
-    csv_files = [f for f in files if f.endswith('.csv')]
+    csv_files = sorted(csv_agent.dataframes)
     return render_template('main.html', response="Erro 500: Erro interno do servidor. Por favor, tente novamente mais tarde.", files=csv_files, models=FREE_MODELS), 500